@@ -0,0 +1,325 @@
+"""对 /v1/chat/completions 做分级并发压测，结果保存为 JSON 以便在不同提交之间对比
+
+    # 自动拉起模拟上游、模拟网页和代理，依次压测 1/8/32 并发
+    python benchmarks/load_test.py --spawn --concurrency 1 8 32 --requests 200
+
+    # 同时触发链接解析、图片识别和联网搜索；任一预处理没有执行时以非零状态退出
+    python benchmarks/load_test.py --spawn --with-url --with-image --with-search
+
+    # 压测已运行的代理，并与上一次结果对比
+    python benchmarks/load_test.py --url http://127.0.0.1:4120 --api-key KEY --proxy-pid 1234 \\
+        --compare benchmarks/results/old.json
+"""
+from typing import List, Dict, Any, Optional
+from pathlib import Path
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import re
+import time
+import httpx
+
+ROOT = Path(__file__).resolve().parent.parent
+RESULTS_DIR = ROOT / "benchmarks" / "results"
+
+def percentile(values: List[float], pct: float) -> Optional[float]:
+    if not values:
+        return None
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, int(round(pct / 100 * len(ordered))) - 1))
+    return round(ordered[index], 2)
+
+def summarize(values: List[float]) -> Dict[str, Optional[float]]:
+    return {
+        "p50": percentile(values, 50),
+        "p99": percentile(values, 99),
+        "mean": round(sum(values) / len(values), 2) if values else None
+    }
+
+def read_process_stats(pid: Optional[int]) -> Dict[str, Optional[float]]:
+    """从 /proc 读取进程 CPU 时间（秒）和 RSS（MB），非 Linux 环境返回空值"""
+    if not pid:
+        return {"cpu_seconds": None, "rss_mb": None}
+    try:
+        fields = Path(f"/proc/{pid}/stat").read_text().rsplit(")", 1)[1].split()
+        ticks = os.sysconf(os.sysconf_names["SC_CLK_TCK"])
+        cpu_seconds = (int(fields[11]) + int(fields[12])) / ticks
+        rss_mb = None
+        for line in Path(f"/proc/{pid}/status").read_text().splitlines():
+            if line.startswith("VmRSS:"):
+                rss_mb = int(line.split()[1]) / 1024
+        return {"cpu_seconds": cpu_seconds, "rss_mb": rss_mb}
+    except (OSError, ValueError, KeyError, IndexError):
+        return {"cpu_seconds": None, "rss_mb": None}
+
+# 1x1 PNG，--with-image 时附在每个请求中触发图片识别
+TINY_PNG = (
+    "data:image/png;base64,iVBORw0KGgoAAAANSUhEUgAAAAEAAAABCAYAAAAfFcSJAAAADUlEQVR42mP8"
+    "z8BQDwAEhQGAhKmMIQAAAABJRU5ErkJggg=="
+)
+UPSTREAM_COUNTER = re.compile(
+    r'^modelmix_upstream_requests_total\{[^}]*upstream="(?P<upstream>[^"]*)",outcome="(?P<outcome>[^"]*)"\} (?P<value>\S+)$'
+)
+
+def build_payload(args, index: int) -> Dict[str, Any]:
+    content: Any = f"请求 {index}：请解释一下什么是负载测试？"
+    if args.web_url:
+        content += f" 参考 {args.web_url}/page/{index % args.pages}"
+    if args.with_image:
+        content = [{"type": "text", "text": content}, {"type": "image_url", "image_url": {"url": TINY_PNG}}]
+    return {
+        "model": args.model,
+        "messages": [{"role": "user", "content": content}],
+        "stream": not args.no_stream
+    }
+
+def read_upstream_counts(url: str) -> Optional[Dict[str, float]]:
+    """从代理的 /metrics 读取各上游成功调用的次数，无法访问时返回 None"""
+    try:
+        response = httpx.get(f"{url}/metrics", timeout=5.0)
+        response.raise_for_status()
+    except httpx.HTTPError:
+        return None
+    counts: Dict[str, float] = {}
+    for line in response.text.splitlines():
+        match = UPSTREAM_COUNTER.match(line)
+        if match and match.group("outcome") in ("ok", "cache_hit"):
+            counts[match.group("upstream")] = counts.get(match.group("upstream"), 0) + float(match.group("value"))
+    return counts
+
+def expected_enrichment(args) -> List[str]:
+    """本次压测应当触发的预处理上游：搜索判断总会执行，链接和图片按参数决定"""
+    expected = ["search"]
+    if args.web_url:
+        expected.append("web")
+    if args.with_image:
+        expected.append("image")
+    return expected
+
+async def run_one(client: httpx.AsyncClient, args, index: int) -> Dict[str, Any]:
+    started = time.perf_counter()
+    ttft = None
+    try:
+        async with client.stream(
+            "POST",
+            f"{args.url}/v1/chat/completions",
+            json=build_payload(args, index),
+            headers={"Authorization": f"Bearer {args.api_key}"}
+        ) as response:
+            if response.status_code != 200:
+                await response.aread()
+                return {"ok": False}
+            async for line in response.aiter_lines():
+                if ttft is None and line.startswith("data: "):
+                    ttft = time.perf_counter() - started
+                if '"error"' in line:
+                    return {"ok": False}
+    except httpx.HTTPError:
+        return {"ok": False}
+    latency = time.perf_counter() - started
+    return {"ok": True, "ttft": ttft if ttft is not None else latency, "latency": latency}
+
+async def run_level(args, concurrency: int) -> Dict[str, Any]:
+    semaphore = asyncio.Semaphore(concurrency)
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+
+    async with httpx.AsyncClient(timeout=args.timeout, limits=limits) as client:
+        async def bounded(index: int) -> Dict[str, Any]:
+            async with semaphore:
+                return await run_one(client, args, index)
+
+        before = read_process_stats(args.proxy_pid)
+        counts_before = read_upstream_counts(args.url)
+        started = time.perf_counter()
+        results = await asyncio.gather(*[bounded(index) for index in range(args.requests)])
+        elapsed = time.perf_counter() - started
+        after = read_process_stats(args.proxy_pid)
+        counts_after = read_upstream_counts(args.url)
+
+    enrichment = None
+    if counts_before is not None and counts_after is not None:
+        # 每个预处理上游在本等级内成功（含缓存命中）的调用次数
+        enrichment = {
+            upstream: int(counts_after.get(upstream, 0) - counts_before.get(upstream, 0))
+            for upstream in expected_enrichment(args)
+        }
+
+    succeeded = [result for result in results if result["ok"]]
+    cpu_ms_per_stream = None
+    if before["cpu_seconds"] is not None and after["cpu_seconds"] is not None and succeeded:
+        cpu_ms_per_stream = round((after["cpu_seconds"] - before["cpu_seconds"]) * 1000 / len(succeeded), 3)
+    return {
+        "concurrency": concurrency,
+        "requests": len(results),
+        "errors": len(results) - len(succeeded),
+        "duration_s": round(elapsed, 3),
+        "rps": round(len(succeeded) / elapsed, 2) if elapsed else None,
+        "ttft_ms": summarize([result["ttft"] * 1000 for result in succeeded]),
+        "latency_ms": summarize([result["latency"] * 1000 for result in succeeded]),
+        "cpu_ms_per_stream": cpu_ms_per_stream,
+        "rss_mb": round(after["rss_mb"], 1) if after["rss_mb"] is not None else None,
+        "enrichment": enrichment
+    }
+
+def wait_for_port(url: str, timeout: float = 15.0) -> None:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            httpx.get(url, timeout=1.0)
+            return
+        except httpx.HTTPError:
+            time.sleep(0.2)
+    raise RuntimeError(f"服务未能在 {timeout} 秒内启动: {url}")
+
+def spawn_services(args) -> List[subprocess.Popen]:
+    """启动模拟上游、模拟网页和代理，并把代理的上游地址全部指向模拟服务"""
+    upstream = f"http://127.0.0.1:{args.upstream_port}"
+    web = f"http://127.0.0.1:{args.web_port}"
+    processes = [
+        subprocess.Popen([
+            sys.executable, str(ROOT / "benchmarks" / "mock_upstream.py"),
+            "--port", str(args.upstream_port),
+            "--delay", str(args.upstream_delay),
+            "--token-rate", str(args.token_rate),
+            "--tokens", str(args.tokens),
+            "--error-rate", str(args.error_rate),
+            # 搜索判断回答 yes 时才会执行联网搜索
+            "--reply", "yes" if args.with_search else "no"
+        ]),
+        subprocess.Popen([
+            sys.executable, str(ROOT / "benchmarks" / "mock_web.py"),
+            "--port", str(args.web_port)
+        ])
+    ]
+    env = {
+        **os.environ,
+        "PROXY_URL": upstream,
+        "PROXY_URL2": upstream,
+        "PROXY_URL3": upstream,
+        "PROXY_URL4": upstream,
+        "DEEPSEEK_R1_MODEL": "mock-r1",
+        "Model_output_MODEL": "mock-output",
+        "OUTPUT_API_KEY": args.api_key,
+        "HYBRID_MODEL_NAME": args.model
+    }
+    proxy = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--port", str(args.proxy_port), "--log-level", "warning"],
+        cwd=str(ROOT),
+        env=env
+    )
+    processes.append(proxy)
+    wait_for_port(f"{upstream}/docs")
+    wait_for_port(f"{web}/docs")
+    wait_for_port(f"http://127.0.0.1:{args.proxy_port}/docs")
+    args.url = f"http://127.0.0.1:{args.proxy_port}"
+    args.proxy_pid = proxy.pid
+    if args.with_url:
+        args.web_url = web
+    return processes
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=str(ROOT), text=True
+        ).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def compare(current: Dict[str, Any], baseline_path: str) -> None:
+    baseline = json.loads(Path(baseline_path).read_text(encoding="utf-8"))
+    previous = {level["concurrency"]: level for level in baseline["levels"]}
+    print(f"\n与 {baseline_path}（{baseline.get('commit')}）对比:")
+    for level in current["levels"]:
+        old = previous.get(level["concurrency"])
+        if not old:
+            continue
+        rows = [
+            ("rps", old["rps"], level["rps"]),
+            ("ttft p50", old["ttft_ms"]["p50"], level["ttft_ms"]["p50"]),
+            ("ttft p99", old["ttft_ms"]["p99"], level["ttft_ms"]["p99"]),
+            ("latency p99", old["latency_ms"]["p99"], level["latency_ms"]["p99"])
+        ]
+        for name, before, after in rows:
+            if before and after is not None:
+                print(f"  c={level['concurrency']:<4} {name:<12} {before:>10} -> {after:<10} ({(after - before) / before:+.1%})")
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="ModelMix 代理压测")
+    parser.add_argument("--url", default="http://127.0.0.1:4120")
+    parser.add_argument("--api-key", default="bench")
+    parser.add_argument("--model", default="GeminiMIXR1")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 8, 32])
+    parser.add_argument("--requests", type=int, default=100, help="每个并发等级的请求数")
+    parser.add_argument("--timeout", type=float, default=120.0)
+    parser.add_argument("--no-stream", action="store_true")
+    parser.add_argument("--proxy-pid", type=int, help="代理进程 PID，用于统计 CPU 和 RSS")
+    parser.add_argument("--web-url", help="在消息中附带该网页服务器的 URL，触发 URL 解析")
+    parser.add_argument("--pages", type=int, default=20, help="附带 URL 时轮换的页面数")
+    parser.add_argument("--spawn", action="store_true", help="自动启动模拟上游、模拟网页和代理")
+    parser.add_argument("--with-url", action="store_true", help="--spawn 时在消息中附带模拟网页 URL")
+    parser.add_argument("--with-image", action="store_true", help="在消息中附带图片，触发图片识别")
+    parser.add_argument("--with-search", action="store_true", help="--spawn 时让模拟上游判断需要搜索，触发联网搜索")
+    parser.add_argument("--proxy-port", type=int, default=9100)
+    parser.add_argument("--upstream-port", type=int, default=9101)
+    parser.add_argument("--web-port", type=int, default=9102)
+    parser.add_argument("--upstream-delay", type=float, default=0.2)
+    parser.add_argument("--token-rate", type=float, default=100.0)
+    parser.add_argument("--tokens", type=int, default=100)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--output", help="结果文件路径，默认 benchmarks/results/<commit>-<时间>.json")
+    parser.add_argument("--compare", help="与之前保存的结果文件对比")
+    args = parser.parse_args()
+
+    processes = spawn_services(args) if args.spawn else []
+    # 各预处理上游在整个压测中的调用次数；后面的等级可能全部命中缓存，所以按总数检查
+    enrichment_totals: Dict[str, int] = {}
+    try:
+        levels = []
+        for concurrency in args.concurrency:
+            level = asyncio.run(run_level(args, concurrency))
+            levels.append(level)
+            print(
+                f"c={concurrency:<4} rps={level['rps']} errors={level['errors']} "
+                f"ttft p50/p99={level['ttft_ms']['p50']}/{level['ttft_ms']['p99']}ms "
+                f"latency p50/p99={level['latency_ms']['p50']}/{level['latency_ms']['p99']}ms "
+                f"cpu/stream={level['cpu_ms_per_stream']}ms rss={level['rss_mb']}MB "
+                f"enrichment={level['enrichment']}"
+            )
+            if level["enrichment"] is None:
+                print("  无法读取代理的 /metrics，未检查预处理是否执行")
+            else:
+                for upstream, calls in level["enrichment"].items():
+                    enrichment_totals[upstream] = enrichment_totals.get(upstream, 0) + calls
+    finally:
+        for process in processes:
+            process.terminate()
+        for process in processes:
+            process.wait(timeout=10)
+
+    commit = git_commit()
+    result = {
+        "commit": commit,
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "config": {
+            key: value for key, value in vars(args).items()
+            if key not in ("api_key", "output", "compare")
+        },
+        "levels": levels
+    }
+    output = Path(args.output) if args.output else RESULTS_DIR / f"{commit or 'unknown'}-{time.strftime('%Y%m%d-%H%M%S')}.json"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(result, ensure_ascii=False, indent=2), encoding="utf-8")
+    print(f"结果已保存: {output}")
+
+    if args.compare:
+        compare(result, args.compare)
+    missing = [upstream for upstream, calls in enrichment_totals.items() if not calls]
+    if missing:
+        # 预处理没有执行时压测结果不代表真实负载，以非零状态退出
+        sys.exit(f"以下预处理上游没有成功调用，请检查代理配置: {', '.join(missing)}")
+
+if __name__ == "__main__":
+    main()
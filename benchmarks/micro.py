@@ -0,0 +1,310 @@
+"""热点函数微基准：按输入规模记录耗时曲线，结果保存为 JSON 以便验证优化效果
+
+    python benchmarks/micro.py                      # 运行全部基准
+    python benchmarks/micro.py --only sse parse_url # 只运行名称包含这些关键字的基准
+    python benchmarks/micro.py --quick --compare benchmarks/results/micro-old.json
+"""
+from typing import Callable, List, Dict, Any, Optional, Tuple
+from io import BytesIO
+from pathlib import Path
+import argparse
+import asyncio
+import base64
+import importlib.util
+import json
+import subprocess
+import sys
+import time
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+RESULTS_DIR = ROOT / "benchmarks" / "results"
+
+# 每个基准的说明： (名称, 规模列表, 规模单位, 构造输入函数, 被测函数)
+BENCHMARKS: List[Tuple[str, List[int], str, Callable[[int], Any], Callable[[Any], Any]]] = []
+
+def benchmark(name: str, sizes: List[int], unit: str, setup: Callable[[int], Any]):
+    def decorator(run: Callable[[Any], Any]):
+        BENCHMARKS.append((name, sizes, unit, setup, run))
+        return run
+    return decorator
+
+async def time_coroutine(run: Callable[[Any], Any], data: Any) -> float:
+    started = time.perf_counter()
+    await run(data)
+    return time.perf_counter() - started
+
+def measure(setup: Callable[[int], Any], run: Callable[[Any], Any], size: int, min_time: float) -> Dict[str, float]:
+    """每轮都重新构造输入（不计时），至少运行 min_time 秒或 5 轮；
+    异步被测函数在同一个事件循环中执行，只计 await 本身的耗时，不计事件循环的创建与关闭"""
+    timings = []
+    deadline = time.perf_counter() + min_time
+    while len(timings) < 5 or time.perf_counter() < deadline:
+        data = setup(size)
+        if asyncio.iscoroutinefunction(run):
+            timings.append(LOOP.run_until_complete(time_coroutine(run, data)))
+            continue
+        started = time.perf_counter()
+        run(data)
+        timings.append(time.perf_counter() - started)
+        if len(timings) >= 1000:
+            break
+    timings.sort()
+    return {
+        "rounds": len(timings),
+        "min_ms": round(timings[0] * 1000, 4),
+        "median_ms": round(timings[len(timings) // 2] * 1000, 4),
+        "per_unit_us": round(timings[len(timings) // 2] * 1e6 / size, 4)
+    }
+
+def load_legacy_utils():
+    """utils.py 与 utils/ 包同名，按文件路径单独加载"""
+    spec = importlib.util.spec_from_file_location("utils_legacy", ROOT / "utils.py")
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+# ---------- sanitize_content ----------
+
+def multimodal_payload(images: int, image_kb: int = 256) -> List[Dict[str, Any]]:
+    image = "data:image/png;base64," + base64.b64encode(b"\x89PNG" * (image_kb * 256)).decode()
+    content: List[Dict[str, Any]] = [{"type": "text", "text": "请描述这些图片"}]
+    for _ in range(images):
+        content.append({"type": "image_url", "image_url": {"url": image, "detail": "auto"}})
+    return content
+
+@benchmark("helpers.sanitize_content", [1, 4, 16, 64], "images", multimodal_payload)
+def _run_helpers_sanitize(payload):
+    from utils.helpers import sanitize_content
+    sanitize_content(payload)
+
+@benchmark("utils.sanitize_content", [1, 4, 16, 64], "images", multimodal_payload)
+def _run_legacy_sanitize(payload):
+    LEGACY_UTILS.sanitize_content(payload)
+
+def multimodal_messages(images: int) -> List[Dict[str, Any]]:
+    return [{"role": "user", "content": multimodal_payload(images)}]
+
+@benchmark("ImageBuffer.detach", [1, 4, 16, 64], "images", multimodal_messages)
+def _run_image_detach(messages):
+    from modules.image_processor import ImageBuffer
+    json.dumps(ImageBuffer.detach(messages)[0])
+
+# ---------- format_sse_message ----------
+
+def sse_chunk(size: int) -> Dict[str, Any]:
+    return {
+        "id": "chatcmpl-bench",
+        "object": "chat.completion.chunk",
+        "created": 0,
+        "model": "bench",
+        "choices": [{"delta": {"content": "字" * size}, "index": 0, "finish_reason": None}]
+    }
+
+@benchmark("format_sse_message", [16, 256, 4096, 65536], "chars", sse_chunk)
+def _run_sse(data):
+    from utils.helpers import format_sse_message
+    format_sse_message(data)
+
+# ---------- WebParser.preprocess_messages ----------
+
+def url_history(turns: int, urls_per_turn: int = 2) -> List[Dict[str, Any]]:
+    messages = []
+    for turn in range(turns):
+        links = " ".join(f"https://example.com/page/{turn}-{index}" for index in range(urls_per_turn))
+        messages.append({"role": "user", "content": f"第 {turn} 轮问题，参考 {links} 这些链接。" + "补充说明。" * 20})
+        messages.append({"role": "assistant", "content": "这是之前的回答。" * 40})
+    return messages
+
+def cached_url_history(size: int) -> List[Dict[str, Any]]:
+    parser = WEB_PARSER
+    messages = url_history(size)
+    # 预先填充缓存，只测量 URL 扫描与替换，不访问网络
+    for turn in range(size):
+        for index in range(2):
+            parser.url_cache.set(f"https://example.com/page/{turn}-{index}", "标题：缓存页面\n\n正文：\n" + "内容" * 200)
+    return messages
+
+@benchmark("WebParser.preprocess_messages", [10, 50, 200, 500], "turns", cached_url_history)
+async def _run_preprocess(messages):
+    await WEB_PARSER.preprocess_messages(messages)
+
+# ---------- WebParser._parse_url ----------
+
+HTML_PAGES: Dict[int, str] = {}
+
+def stored_pages() -> Dict[int, str]:
+    """默认使用 mock_web 生成的页面；--html-dir 指定时改用保存下来的真实页面（按文件大小排序）"""
+    if HTML_PAGES:
+        return HTML_PAGES
+    if ARGS.html_dir:
+        for path in sorted(Path(ARGS.html_dir).glob("*.htm*"), key=lambda p: p.stat().st_size):
+            html = path.read_text(encoding="utf-8", errors="ignore")
+            HTML_PAGES[len(html) // 1024 or 1] = html
+    else:
+        from benchmarks.mock_web import render_page
+        for paragraphs in (10, 100, 1000, 5000):
+            html = render_page(0, paragraphs)
+            HTML_PAGES[len(html) // 1024 or 1] = html
+    return HTML_PAGES
+
+def parse_url_sizes() -> List[int]:
+    return sorted(stored_pages())
+
+def stored_page(size: int):
+    import httpx
+
+    # 用 MockTransport 返回保存的页面，只测量下载之后的解析与提取
+    html = stored_pages()[size]
+    return httpx.AsyncClient(transport=httpx.MockTransport(
+        lambda request: httpx.Response(200, text=html, headers={"Content-Type": "text/html"})
+    ))
+
+@benchmark("WebParser._parse_url", [], "KB", stored_page)
+async def _run_parse_url(client):
+    WEB_PARSER.client, original = client, WEB_PARSER.client
+    try:
+        await WEB_PARSER._parse_url("https://example.com/stored")
+    finally:
+        WEB_PARSER.client = original
+
+# ---------- FileParser ----------
+
+def csv_bytes(rows: int) -> bytes:
+    lines = ["id,name,city,amount"] + [f"{index},用户{index},城市{index % 50},{index * 1.5}" for index in range(rows)]
+    return "\n".join(lines).encode("utf-8")
+
+def xlsx_bytes(rows: int) -> bytes:
+    import pandas as pd
+
+    buffer = BytesIO()
+    pd.read_csv(BytesIO(csv_bytes(rows))).to_excel(buffer, index=False)
+    return buffer.getvalue()
+
+def docx_bytes(paragraphs: int) -> bytes:
+    import docx
+
+    document = docx.Document()
+    for index in range(paragraphs):
+        document.add_paragraph(f"第 {index} 段：用于测试 Word 解析性能的正文内容。")
+    buffer = BytesIO()
+    document.save(buffer)
+    return buffer.getvalue()
+
+def pdf_bytes(pages: int, lines_per_page: int = 40) -> bytes:
+    """不依赖第三方库生成只包含 ASCII 文本的多页 PDF"""
+    objects = ["<< /Type /Catalog /Pages 2 0 R >>", None, "<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>"]
+    kids = []
+    for page in range(pages):
+        text = "".join(
+            f"BT /F1 10 Tf 40 {800 - line * 18} Td (Page {page} line {line}: benchmark text for pdf parsing) Tj ET\n"
+            for line in range(lines_per_page)
+        )
+        objects.append(f"<< /Length {len(text)} >>\nstream\n{text}endstream")
+        objects.append(
+            f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] "
+            f"/Resources << /Font << /F1 3 0 R >> >> /Contents {len(objects)} 0 R >>"
+        )
+        kids.append(f"{len(objects)} 0 R")
+    objects[1] = f"<< /Type /Pages /Kids [{' '.join(kids)}] /Count {pages} >>"
+
+    output = b"%PDF-1.4\n"
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(len(output))
+        output += f"{number} 0 obj\n{body}\nendobj\n".encode("latin-1")
+    xref = len(output)
+    output += f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n".encode("latin-1")
+    output += "".join(f"{offset:010d} 00000 n \n" for offset in offsets).encode("latin-1")
+    output += f"trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n".encode("latin-1")
+    return output
+
+FILE_SAMPLES = {
+    "csv": ("text/csv", csv_bytes, [100, 1000, 10000]),
+    "xlsx": ("application/vnd.openxmlformats-officedocument.spreadsheetml.sheet", xlsx_bytes, [100, 1000, 5000]),
+    "docx": ("application/vnd.openxmlformats-officedocument.wordprocessingml.document", docx_bytes, [10, 100, 1000]),
+    "pdf": ("application/pdf", pdf_bytes, [1, 10, 50])
+}
+SAMPLE_CACHE: Dict[Tuple[str, int], bytes] = {}
+
+def register_file_benchmarks() -> None:
+    for kind, (mime, build, sizes) in FILE_SAMPLES.items():
+        def setup(size: int, kind=kind, build=build):
+            if (kind, size) not in SAMPLE_CACHE:
+                SAMPLE_CACHE[(kind, size)] = build(size)
+            return SAMPLE_CACHE[(kind, size)]
+
+        def run(content: bytes, mime=mime):
+            from modules.file_parser import FileParser
+            FileParser.parse_file(mime, content)
+
+        unit = "pages" if kind == "pdf" else "paragraphs" if kind == "docx" else "rows"
+        BENCHMARKS.append((f"FileParser.{kind}", sizes, unit, setup, run))
+
+# ---------- 运行与对比 ----------
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=str(ROOT), text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def compare(current: Dict[str, Any], baseline_path: str) -> None:
+    baseline = json.loads(Path(baseline_path).read_text(encoding="utf-8"))
+    print(f"\n与 {baseline_path}（{baseline.get('commit')}）对比（median）:")
+    for name, points in current["benchmarks"].items():
+        previous = {point["size"]: point for point in baseline["benchmarks"].get(name, [])}
+        for point in points:
+            old = previous.get(point["size"])
+            if old and old["median_ms"]:
+                change = (point["median_ms"] - old["median_ms"]) / old["median_ms"]
+                print(f"  {name:<32} size={point['size']:<7} {old['median_ms']:>10} -> {point['median_ms']:<10} ms ({change:+.1%})")
+
+def main() -> None:
+    global ARGS, LEGACY_UTILS, WEB_PARSER, LOOP
+    parser = argparse.ArgumentParser(description="ModelMix 热点函数微基准")
+    parser.add_argument("--only", nargs="*", help="只运行名称包含这些关键字的基准")
+    parser.add_argument("--min-time", type=float, default=0.5, help="每个规模至少运行的秒数")
+    parser.add_argument("--quick", action="store_true", help="每个规模只运行 5 轮")
+    parser.add_argument("--html-dir", help="保存的 HTML 页面目录，用于 _parse_url 基准")
+    parser.add_argument("--output", help="结果文件路径，默认 benchmarks/results/micro-<commit>-<时间>.json")
+    parser.add_argument("--compare", help="与之前保存的结果文件对比")
+    ARGS = parser.parse_args()
+
+    from loguru import logger
+    from modules.web_parser import WebParser
+
+    logger.remove()
+    LEGACY_UTILS = load_legacy_utils()
+    WEB_PARSER = WebParser()
+    LOOP = asyncio.new_event_loop()
+    register_file_benchmarks()
+
+    results: Dict[str, List[Dict[str, Any]]] = {}
+    for name, sizes, unit, setup, run in BENCHMARKS:
+        if ARGS.only and not any(keyword in name for keyword in ARGS.only):
+            continue
+        if name == "WebParser._parse_url":
+            sizes = parse_url_sizes()
+        points = []
+        try:
+            for size in sizes:
+                point = {"size": size, "unit": unit, **measure(setup, run, size, 0 if ARGS.quick else ARGS.min_time)}
+                points.append(point)
+                print(f"{name:<32} {size:>7} {unit:<10} median={point['median_ms']:>10} ms  per {unit}={point['per_unit_us']} us")
+        except ImportError as e:
+            print(f"{name:<32} 跳过（缺少依赖: {e.name}）")
+        results[name] = points
+
+    commit = git_commit()
+    result = {"commit": commit, "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"), "benchmarks": results}
+    output = Path(ARGS.output) if ARGS.output else RESULTS_DIR / f"micro-{commit or 'unknown'}-{time.strftime('%Y%m%d-%H%M%S')}.json"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(result, ensure_ascii=False, indent=2), encoding="utf-8")
+    print(f"结果已保存: {output}")
+
+    if ARGS.compare:
+        compare(result, ARGS.compare)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,109 @@
+"""模拟 OpenAI 兼容上游（可同时充当 PROXY_URL ~ PROXY_URL4），支持首 token 延迟、出字速率和错误注入
+
+    python benchmarks/mock_upstream.py --port 9101 --delay 0.2 --token-rate 50 --tokens 200 --error-rate 0.01
+"""
+from typing import Dict, Any
+import argparse
+import asyncio
+import json
+import random
+import time
+import uuid
+from fastapi import FastAPI, Request
+from fastapi.responses import StreamingResponse, JSONResponse
+
+CONFIG: Dict[str, Any] = {
+    "delay": 0.2,             # 首 token 前的等待时间（秒）
+    "token_rate": 50.0,       # 每秒输出的 token 数，0 表示不限速
+    "tokens": 200,            # 每次回答输出的 token 数
+    "reasoning_tokens": 100,  # 思考模型额外输出的 reasoning_content token 数
+    "reasoning_model": "mock-r1",
+    "error_rate": 0.0,        # 返回 500 的概率
+    "stream_error_rate": 0.0, # 流式输出中途断开的概率
+    "reply": "no"             # 非流式调用（搜索判断、图片识别）返回的内容
+}
+
+app = FastAPI()
+trace_stats = {"batches": 0, "spans": 0}
+
+def _chunk(completion_id: str, delta: Dict[str, Any], finish_reason=None) -> str:
+    data = {
+        "id": completion_id,
+        "object": "chat.completion.chunk",
+        "created": int(time.time()),
+        "model": "mock",
+        "choices": [{"delta": delta, "index": 0, "finish_reason": finish_reason}]
+    }
+    return f"data: {json.dumps(data)}\n\n"
+
+async def _stream(model: str):
+    completion_id = f"chatcmpl-{uuid.uuid4().hex}"
+    interval = 1.0 / CONFIG["token_rate"] if CONFIG["token_rate"] else 0
+    break_at = random.randint(1, CONFIG["tokens"]) if random.random() < CONFIG["stream_error_rate"] else None
+
+    if model == CONFIG["reasoning_model"]:
+        for _ in range(CONFIG["reasoning_tokens"]):
+            yield _chunk(completion_id, {"reasoning_content": "think "})
+            await asyncio.sleep(interval)
+    for index in range(CONFIG["tokens"]):
+        if break_at is not None and index == break_at:
+            raise RuntimeError("injected stream error")
+        yield _chunk(completion_id, {"content": "token "})
+        await asyncio.sleep(interval)
+    yield _chunk(completion_id, {}, "stop")
+    yield "data: [DONE]\n\n"
+
+@app.post("/v1/chat/completions")
+async def completions(request: Request):
+    body = await request.json()
+    if random.random() < CONFIG["error_rate"]:
+        return JSONResponse(status_code=500, content={"error": {"message": "injected error"}})
+    await asyncio.sleep(CONFIG["delay"])
+    if body.get("stream"):
+        return StreamingResponse(_stream(body.get("model", "")), media_type="text/event-stream")
+    return JSONResponse(content={
+        "id": f"chatcmpl-{uuid.uuid4().hex}",
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": body.get("model", "mock"),
+        "choices": [{
+            "index": 0,
+            "message": {"role": "assistant", "content": CONFIG["reply"]},
+            "finish_reason": "stop"
+        }]
+    })
+
+@app.post("/v1/traces")
+async def traces(request: Request):
+    """本地追踪采集器替身，只统计收到的 span 数"""
+    body = await request.json()
+    trace_stats["batches"] += 1
+    for resource in body.get("resourceSpans", []):
+        for scope in resource.get("scopeSpans", []):
+            trace_stats["spans"] += len(scope.get("spans", []))
+    return JSONResponse(content={})
+
+@app.get("/v1/traces/stats")
+async def get_trace_stats():
+    return JSONResponse(content=trace_stats)
+
+def main() -> None:
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description="模拟 OpenAI 兼容的 SSE 上游")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9101)
+    parser.add_argument("--delay", type=float, default=CONFIG["delay"])
+    parser.add_argument("--token-rate", type=float, default=CONFIG["token_rate"])
+    parser.add_argument("--tokens", type=int, default=CONFIG["tokens"])
+    parser.add_argument("--reasoning-tokens", type=int, default=CONFIG["reasoning_tokens"])
+    parser.add_argument("--reasoning-model", default=CONFIG["reasoning_model"])
+    parser.add_argument("--error-rate", type=float, default=CONFIG["error_rate"])
+    parser.add_argument("--stream-error-rate", type=float, default=CONFIG["stream_error_rate"])
+    parser.add_argument("--reply", default=CONFIG["reply"])
+    args = parser.parse_args()
+    CONFIG.update({key: value for key, value in vars(args).items() if key in CONFIG})
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+if __name__ == "__main__":
+    main()
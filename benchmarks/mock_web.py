@@ -0,0 +1,45 @@
+"""模拟网页服务器，供 WebParser 的 URL 解析压测使用
+
+    python benchmarks/mock_web.py --port 9102 --delay 0.05 --paragraphs 50
+访问 /page/{n}?paragraphs=200 可以单独指定页面大小
+"""
+from typing import Optional
+import argparse
+import asyncio
+from fastapi import FastAPI
+from fastapi.responses import HTMLResponse
+
+CONFIG = {"delay": 0.05, "paragraphs": 50}
+
+app = FastAPI()
+
+def render_page(page: int, paragraphs: int) -> str:
+    body = "\n".join(
+        f"<p>第 {page} 页第 {index} 段：这是一段用于压测网页解析的正文内容，长度超过二十个字符。</p>"
+        for index in range(paragraphs)
+    )
+    return (
+        f"<html><head><title>Mock page {page}</title><script>var x = 1;</script></head>"
+        f"<body><div class=\"banner\">广告</div><h1>Mock page {page}</h1>"
+        f"<article>{body}</article></body></html>"
+    )
+
+@app.get("/page/{page}")
+async def get_page(page: int, paragraphs: Optional[int] = None):
+    await asyncio.sleep(CONFIG["delay"])
+    return HTMLResponse(render_page(page, paragraphs or CONFIG["paragraphs"]))
+
+def main() -> None:
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description="模拟网页服务器")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9102)
+    parser.add_argument("--delay", type=float, default=CONFIG["delay"])
+    parser.add_argument("--paragraphs", type=int, default=CONFIG["paragraphs"])
+    args = parser.parse_args()
+    CONFIG.update(delay=args.delay, paragraphs=args.paragraphs)
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+"""冷启动基准：在全新的解释器中导入 main，记录导入耗时、RSS 和最耗时的模块，结果保存为 JSON
+
+    python benchmarks/startup.py                    # 默认重复 5 次取中位数
+    python benchmarks/startup.py --compare benchmarks/results/startup-old.json
+"""
+from typing import List, Dict, Any, Tuple
+from pathlib import Path
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+
+ROOT = Path(__file__).resolve().parent.parent
+RESULTS_DIR = ROOT / "benchmarks" / "results"
+
+# 在子进程中执行：导入 main 后输出启动报告
+PROBE = (
+    "import json, main\n"
+    "from utils.startup import startup_report\n"
+    "print('STARTUP ' + json.dumps(startup_report(main.IMPORT_STARTED)))\n"
+)
+
+def run_once(env: Dict[str, str]) -> Tuple[Dict[str, Any], List[Tuple[str, int]]]:
+    """返回 (启动报告, [(模块名, 自身导入耗时 us)])"""
+    completed = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", PROBE],
+        cwd=str(ROOT), env=env, capture_output=True, text=True, check=True
+    )
+    report = {}
+    for line in completed.stdout.splitlines():
+        if line.startswith("STARTUP "):
+            report = json.loads(line[len("STARTUP "):])
+    modules = []
+    for line in completed.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, _, name = line[len("import time:"):].split("|")
+        modules.append((name.strip(), int(self_us)))
+    return report, modules
+
+def git_commit():
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=str(ROOT), text=True
+        ).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def compare(current: Dict[str, Any], baseline_path: str) -> None:
+    baseline = json.loads(Path(baseline_path).read_text(encoding="utf-8"))
+    print(f"\n与 {baseline_path}（{baseline.get('commit')}）对比:")
+    for name in ("startup_seconds", "rss_mb"):
+        before, after = baseline.get(name), current.get(name)
+        if before and after is not None:
+            print(f"  {name:<16} {before:>10} -> {after:<10} ({(after - before) / before:+.1%})")
+    added = sorted(set(current["heavy_modules"]) - set(baseline.get("heavy_modules", [])))
+    if added:
+        print(f"  新增的重量级模块: {', '.join(added)}")
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="ModelMix 冷启动基准")
+    parser.add_argument("--repeat", type=int, default=5, help="重复启动次数，取中位数")
+    parser.add_argument("--top", type=int, default=15, help="列出自身导入耗时最多的模块数")
+    parser.add_argument("--output", help="结果文件路径，默认 benchmarks/results/startup-<commit>-<时间>.json")
+    parser.add_argument("--compare", help="与之前保存的结果文件对比")
+    args = parser.parse_args()
+
+    # 降低日志级别，减少启动日志与 importtime 输出混在一起
+    env = {**os.environ, "LOG_LEVEL": "WARNING"}
+    runs = [run_once(env) for _ in range(args.repeat)]
+    reports = sorted((report for report, _ in runs), key=lambda report: report["startup_seconds"])
+    median = reports[len(reports) // 2]
+
+    totals: Dict[str, List[int]] = {}
+    for _, modules in runs:
+        for name, self_us in modules:
+            totals.setdefault(name, []).append(self_us)
+    slowest = sorted(
+        ((name, sorted(values)[len(values) // 2]) for name, values in totals.items()),
+        key=lambda item: item[1], reverse=True
+    )[:args.top]
+
+    print(f"startup={median['startup_seconds']}s rss={median['rss_mb']}MB heavy={median['heavy_modules']}")
+    for name, self_us in slowest:
+        print(f"  {name:<48} {self_us / 1000:>8.1f} ms")
+
+    commit = git_commit()
+    result = {
+        "commit": commit,
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "repeat": args.repeat,
+        **median,
+        "slowest_modules_ms": {name: round(self_us / 1000, 2) for name, self_us in slowest}
+    }
+    output = Path(args.output) if args.output else RESULTS_DIR / f"startup-{commit or 'unknown'}-{time.strftime('%Y%m%d-%H%M%S')}.json"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(result, ensure_ascii=False, indent=2), encoding="utf-8")
+    print(f"结果已保存: {output}")
+
+    if args.compare:
+        compare(result, args.compare)
+
+if __name__ == "__main__":
+    main()
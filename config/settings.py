@@ -20,19 +20,66 @@ class OutputModelSettings:
     Model_output_MAX_TOKENS = int(os.getenv('Model_output_MAX_TOKENS', 7985))
     Model_output_TEMPERATURE = float(os.getenv('Model_output_TEMPERATURE', 0.4))
     Model_output_WebSearch = os.getenv('Model_output_WebSearch') == 'True'
+    # 把思考模型的推理过程交给输出模型时使用的前缀
+    OUTPUT_REASONING_PROMPT = os.getenv(
+        'OUTPUT_REASONING_PROMPT',
+        '以下是思考模型针对本次对话的推理过程，请参考它直接给出最终回答：\n'
+    )
 
-class Settings:
+class SearchModelSettings:
+    # 联网搜索模型（判断是否需要搜索、生成搜索词并执行搜索）的配置
+    GoogleSearch_API_KEY = os.getenv('GoogleSearch_API_KEY', os.getenv('GOOGLE_SEARCH_API_KEY'))
+    GoogleSearch_MODEL = os.getenv('GoogleSearch_MODEL')
+    GoogleSearch_Model_MAX_TOKENS = int(os.getenv('GoogleSearch_Model_MAX_TOKENS', 1024))
+    GoogleSearch_Model_TEMPERATURE = float(os.getenv('GoogleSearch_Model_TEMPERATURE', 0.2))
+    # 判断提示词要求模型只回答 yes 或 no
+    GoogleSearch_Determine_PROMPT = os.getenv(
+        'GoogleSearch_Determine_PROMPT',
+        '判断回答用户最后一个问题是否需要联网搜索最新信息，只回答 yes 或 no。'
+    )
+    GoogleSearch_PROMPT = os.getenv(
+        'GoogleSearch_PROMPT',
+        os.getenv('GOOGLE_SEARCH_PROMPT') or '根据对话内容生成用于网络搜索的关键词，只输出关键词。'
+    )
+    # 把搜索结果交给模型时使用的前缀
+    GoogleSearch_Send_PROMPT = os.getenv('GoogleSearch_Send_PROMPT', '以下是联网搜索得到的参考信息：\n')
+
+class ImageModelSettings:
+    # 图片识别模型（把图片转为文字描述）的配置
+    Image_Model_API_KEY = os.getenv('Image_Model_API_KEY', os.getenv('IMAGE_MODEL_API_KEY'))
+    Image_MODEL = os.getenv('Image_MODEL', os.getenv('IMAGE_MODEL'))
+    Image_Model_MAX_TOKENS = int(os.getenv('Image_Model_MAX_TOKENS', 1024))
+    Image_Model_TEMPERATURE = float(os.getenv('Image_Model_TEMPERATURE', 0.2))
+    Image_Model_PROMPT = os.getenv(
+        'Image_Model_PROMPT',
+        os.getenv('IMAGE_MODEL_PROMPT') or '详细描述图片中的内容，包括其中的文字、数据和关键细节。'
+    )
+    # 把图片描述交给模型时使用的前缀
+    Image_SendR1_PROMPT = os.getenv('Image_SendR1_PROMPT', '以下是用户发送的图片的描述：\n')
+
+class Settings(ThinkingModelSettings, OutputModelSettings, SearchModelSettings, ImageModelSettings):
     # 代理设置
     PROXY_URL = os.getenv('PROXY_URL')
+    PROXY_URL2 = os.getenv('PROXY_URL2', PROXY_URL)  # 输出模型
+    PROXY_URL3 = os.getenv('PROXY_URL3', PROXY_URL)  # 图片识别模型
+    PROXY_URL4 = os.getenv('PROXY_URL4', PROXY_URL)  # 联网搜索模型
     PROXY_PORT = int(os.getenv('PROXY_PORT', 4120))
     REQUEST_TIMEOUT = int(os.getenv('REQUEST_TIMEOUT', 30))
     REQUEST_MAX_REDIRECTS = int(os.getenv('REQUEST_MAX_REDIRECTS', 5))
+    # 非流式调用要等完整回答生成完毕，读取超时（秒）需要覆盖最长的生成时间
+    COMPLETION_READ_TIMEOUT = float(os.getenv('COMPLETION_READ_TIMEOUT', 600))
     
     # OpenAI 和 Anthropic 等其他模型的配置
     OPENAI_API_KEY = os.getenv('OPENAI_API_KEY')
+    OPENAI_BASE_URL = os.getenv('OPENAI_BASE_URL', 'https://api.openai.com/v1')
     OPENAI_MODEL = os.getenv('OPENAI_MODEL', 'gpt-4o')
     OPENAI_MAX_TOKENS = int(os.getenv('OPENAI_MAX_TOKENS', 8192))
     OPENAI_TEMPERATURE = float(os.getenv('OPENAI_TEMPERATURE', 0.7))
+    # 调用 OpenAI 模型时放在消息最前面的链式思考提示词
+    OPENAI_THINKING_PROMPT = os.getenv(
+        'OPENAI_THINKING_PROMPT',
+        '请先一步步分析问题，再给出最终回答。'
+    )
     
     ANTHROPIC_API_KEY = os.getenv('ANTHROPIC_API_KEY')
     ANTHROPIC_MODEL = os.getenv('ANTHROPIC_MODEL', 'claude-3')
@@ -66,10 +113,69 @@ class Settings:
     RELAY_PROMPT = os.getenv('RELAY_PROMPT')
     HYBRID_MODEL_NAME = os.getenv('HYBRID_MODEL_NAME', 'GeminiMIXR1')
     OUTPUT_API_KEY = os.getenv('OUTPUT_API_KEY')
-    
+
+    # 响应缓存配置（仅在 temperature 为 0 或请求携带缓存头时生效）
+    RESPONSE_CACHE_ENABLED = os.getenv('RESPONSE_CACHE_ENABLED') == 'True'
+    RESPONSE_CACHE_MAX_ENTRIES = int(os.getenv('RESPONSE_CACHE_MAX_ENTRIES', 1024))
+    RESPONSE_CACHE_TTL = int(os.getenv('RESPONSE_CACHE_TTL', 3600))
+    RESPONSE_CACHE_DIR = os.getenv('RESPONSE_CACHE_DIR')  # 为空时不启用磁盘缓存
+    RESPONSE_CACHE_DISK_MAX_ENTRIES = int(os.getenv('RESPONSE_CACHE_DISK_MAX_ENTRIES', 10000))
+
+    # 搜索判断与搜索结果缓存（秒）
+    SEARCH_CACHE_MAX_ENTRIES = int(os.getenv('SEARCH_CACHE_MAX_ENTRIES', 512))
+    SEARCH_DECISION_CACHE_TTL = int(os.getenv('SEARCH_DECISION_CACHE_TTL', 600))
+    SEARCH_RESULT_CACHE_TTL = int(os.getenv('SEARCH_RESULT_CACHE_TTL', 300))
+
+    # 流水线模式：立即建立 SSE 连接，预处理任务超过截止时间（秒）后直接开始调用模型；其他模式等待全部预处理完成
+    PIPELINE_EARLY_START = os.getenv('PIPELINE_EARLY_START') == 'True'
+    ENRICHMENT_DEADLINE = float(os.getenv('ENRICHMENT_DEADLINE', 3.0))
+
+    # 两阶段推理：推理内容达到该字符数时提前启动输出模型，0 表示等推理结束再启动；
+    # 推理结束时若内容比投机时更长，提前的调用会被丢弃并用完整推理重新调用
+    TWO_STAGE_SPECULATIVE_CHARS = int(os.getenv('TWO_STAGE_SPECULATIVE_CHARS', 0))
+
+    # 共享状态存储：memory 为单进程，sqlite 供多 worker 共享缓存与运行时配置
+    STATE_BACKEND = os.getenv('STATE_BACKEND', 'memory')
+    STATE_DB_PATH = os.getenv('STATE_DB_PATH', 'data/state.db')
+    CONFIG_SYNC_INTERVAL = float(os.getenv('CONFIG_SYNC_INTERVAL', 1.0))
+    URL_CACHE_MAX_ENTRIES = int(os.getenv('URL_CACHE_MAX_ENTRIES', 1024))
+    URL_CACHE_TTL = int(os.getenv('URL_CACHE_TTL', 3600))
+
+    # 请求追踪：采样率为 0 时关闭；span 以 OTLP JSON 写入文件，或发送到采集器
+    TRACE_SAMPLE_RATE = float(os.getenv('TRACE_SAMPLE_RATE', 0.0))
+    TRACE_EXPORT_FILE = os.getenv('TRACE_EXPORT_FILE', 'logs/traces.jsonl')
+    TRACE_COLLECTOR_URL = os.getenv('TRACE_COLLECTOR_URL')
+
+    # 日志配置：队列异步写入，JSON 结构化输出，重复的上游错误按窗口限流
+    LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO')
+    LOG_FILE = os.getenv('LOG_FILE', 'logs/app.log')
+    LOG_JSON = os.getenv('LOG_JSON', 'True') == 'True'
+    LOG_ROTATION = os.getenv('LOG_ROTATION', '10 MB')
+    LOG_RETENTION = os.getenv('LOG_RETENTION', '10 days')
+    LOG_COMPRESSION = os.getenv('LOG_COMPRESSION', 'zip')
+    LOG_ERROR_RATE_LIMIT = int(os.getenv('LOG_ERROR_RATE_LIMIT', 5))
+    LOG_ERROR_RATE_WINDOW = float(os.getenv('LOG_ERROR_RATE_WINDOW', 60))
+
+    # 检查客户端是否已断开的间隔（秒），断开后取消预处理和上游调用
+    DISCONNECT_POLL_INTERVAL = float(os.getenv('DISCONNECT_POLL_INTERVAL', 0.5))
+
+    # 启动预热：在后台导入文件/网页解析后端，并提前建立到上游的连接
+    PREWARM_PARSERS = os.getenv('PREWARM_PARSERS') == 'True'
+    PREWARM_CONNECTIONS = os.getenv('PREWARM_CONNECTIONS') == 'True'
+
+    # 批处理：任务目录、进程内所有任务合计的并发数、每个上游每分钟的请求上限（0 表示不限）和 429/5xx 重试次数
+    BATCH_DIR = os.getenv('BATCH_DIR', 'data/batches')
+    BATCH_CONCURRENCY = int(os.getenv('BATCH_CONCURRENCY', 8))
+    BATCH_UPSTREAM_RPM = float(os.getenv('BATCH_UPSTREAM_RPM', 0))
+    BATCH_MAX_RETRIES = int(os.getenv('BATCH_MAX_RETRIES', 3))
+    # 任务恢复时是否重新执行上次失败的请求
+    BATCH_RETRY_FAILED = os.getenv('BATCH_RETRY_FAILED', 'True') == 'True'
+
     # 实例化模型设置
     thinking_model_settings = ThinkingModelSettings()
     output_model_settings = OutputModelSettings()
+    search_model_settings = SearchModelSettings()
+    image_model_settings = ImageModelSettings()
 
 # 生成全局设置实例
 settings = Settings()
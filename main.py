@@ -1,30 +1,83 @@
+import time
+# 记录开始导入的时间，启动报告据此计算冷启动耗时
+IMPORT_STARTED = time.perf_counter()
+
+from contextlib import asynccontextmanager
 from fastapi import FastAPI, HTTPException, Depends, Request, BackgroundTasks, File, UploadFile, Form
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import StreamingResponse, JSONResponse
+from fastapi.responses import StreamingResponse, JSONResponse, PlainTextResponse, FileResponse, Response
+from starlette.datastructures import Headers, MutableHeaders
 from pydantic import BaseModel
-from typing import List, Optional, Union, Dict, Any
+from typing import List, Optional, Union, Dict, Any, Mapping
 from loguru import logger
 import asyncio
 import json
+import uuid
 import httpx
+from pathlib import Path
 
 from config.settings import settings
 from modules.web_parser import WebParser
-from modules.image_processor import ImageProcessor
+from modules.image_processor import ImageProcessor, ImageBuffer, IMAGE_PLACEHOLDER
 from modules.file_parser import FileParser
 from modules.model_handler import ModelHandler
 from modules.file_handler import FileHandler
+from modules.response_cache import ResponseCache
+from modules.batch_runner import BatchRunner
+from modules.state_backend import RuntimeConfig, flush_writes
+from modules.metrics import render_metrics, CANCELLED_REQUESTS
+from modules.tracing import tracer
 from utils.helpers import format_sse_message, sanitize_content
+from utils.logger import setup_logging, request_id_var
+from utils.startup import startup_report
 
 # 配置日志
-logger.add(
-    "logs/app.log",
-    rotation="1 MB",
-    retention="10 days",
-    level="INFO"
-)
+setup_logging()
 
-app = FastAPI()
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    prewarm_task = None
+    if settings.PREWARM_PARSERS or settings.PREWARM_CONNECTIONS:
+        # 预热在后台进行，不阻塞服务开始接收请求
+        prewarm_task = asyncio.create_task(prewarm())
+    await runtime_config.refresh(force=True)
+    await batch_runner.resume()
+    logger.info(f"启动完成: {startup_report(IMPORT_STARTED)}")
+    yield
+    if prewarm_task is not None:
+        prewarm_task.cancel()
+    await batch_runner.shutdown()
+    await asyncio.gather(
+        model_handler.client.aclose(),
+        web_parser.client.aclose(),
+        image_processor.client.aclose(),
+        return_exceptions=True
+    )
+    await asyncio.to_thread(flush_writes)
+
+async def prewarm():
+    started = time.perf_counter()
+    if settings.PREWARM_PARSERS:
+        loop = asyncio.get_running_loop()
+        for warm in (FileParser.prewarm, WebParser.prewarm):
+            try:
+                await loop.run_in_executor(None, warm)
+            except ImportError as e:
+                logger.warning(f"预热解析后端失败，缺少依赖: {e.name}")
+    if settings.PREWARM_CONNECTIONS:
+        await asyncio.gather(*[
+            warm_connection(url) for url in {settings.PROXY_URL, settings.PROXY_URL2} if url
+        ])
+    logger.info(f"预热完成，耗时 {time.perf_counter() - started:.2f}s: {startup_report(IMPORT_STARTED)}")
+
+async def warm_connection(base_url: str):
+    """发送一个 HEAD 请求，让连接池提前完成 DNS 解析和 TCP/TLS 握手"""
+    try:
+        await model_handler.client.head(base_url)
+    except httpx.HTTPError as e:
+        logger.warning(f"预热连接 {base_url} 失败: {str(e)}")
+
+app = FastAPI(lifespan=lifespan)
 
 # 配置CORS
 app.add_middleware(
@@ -41,6 +94,33 @@ image_processor = ImageProcessor()
 file_parser = FileParser()
 model_handler = ModelHandler()
 file_handler = FileHandler()
+response_cache = ResponseCache()
+runtime_config = RuntimeConfig()
+
+class RequestContextMiddleware:
+    """设置请求 ID 并同步运行时配置。使用纯 ASGI 中间件而不是 @app.middleware("http")，
+    后者包装过的 receive 会让 Request.is_disconnected() 感知不到客户端断开"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        request_id = Headers(scope=scope).get("X-Request-ID") or uuid.uuid4().hex
+        request_id_var.set(request_id)
+        # 多 worker 部署时应用其他 worker 写入的配置修改
+        await runtime_config.refresh()
+
+        async def send_with_request_id(message):
+            if message["type"] == "http.response.start":
+                MutableHeaders(scope=message)["X-Request-ID"] = request_id
+            await send(message)
+
+        await self.app(scope, receive, send_with_request_id)
+
+app.add_middleware(RequestContextMiddleware)
 
 class Message(BaseModel):
     role: str
@@ -63,40 +143,177 @@ async def verify_api_key(request: Request) -> str:
         raise HTTPException(status_code=401, detail="Invalid API key")
     return api_key
 
+async def find_cached_entry(request: ChatRequest, headers: Mapping[str, str]):
+    """返回 (缓存键, 缓存的回答)；请求不可缓存时缓存键为 None"""
+    if not response_cache.enabled:
+        return None, None
+    if not ResponseCache.is_cacheable(request.temperature, headers):
+        return None, None
+    if ResponseCache.is_no_store(headers):
+        return None, None
+
+    cache_key = ResponseCache.make_key(
+        request.model,
+        [message.model_dump() for message in request.messages],
+        request.temperature,
+        request.max_tokens
+    )
+    if ResponseCache.is_bypassed(headers):
+        return cache_key, None
+
+    cached = await response_cache.get(cache_key)
+    if cached is not None:
+        logger.info(f"命中响应缓存: {cache_key[:12]}")
+    return cache_key, cached
+
+async def lookup_response_cache(request: ChatRequest, http_request: Request):
+    """返回 (缓存键, 缓存命中的响应)；请求不可缓存时缓存键为 None"""
+    cache_key, cached = await find_cached_entry(request, http_request.headers)
+    if cached is None:
+        return cache_key, None
+    if request.stream:
+        return cache_key, StreamingResponse(
+            ResponseCache.replay_stream(cached),
+            media_type="text/event-stream"
+        )
+    return cache_key, JSONResponse(content=ResponseCache.build_completion(cached))
+
+def cached_stream(stream, cache_key: Optional[str]):
+    if cache_key is None:
+        return stream
+    return response_cache.record_stream(cache_key, stream)
+
+def completion_response(completion: Dict[str, Any], cache_key: Optional[str]) -> JSONResponse:
+    if cache_key is not None:
+        response_cache.record_completion(cache_key, completion)
+    return JSONResponse(content=completion)
+
+async def run_until_disconnected(coro, http_request: Request):
+    """执行 coro，期间客户端断开则取消它（连同预处理任务和上游调用）并返回 None"""
+    task = asyncio.create_task(coro)
+    try:
+        while True:
+            done, _ = await asyncio.wait({task}, timeout=settings.DISCONNECT_POLL_INTERVAL)
+            if done:
+                return task.result()
+            if await http_request.is_disconnected():
+                logger.info("客户端已断开，取消请求处理")
+                CANCELLED_REQUESTS.inc(stage="handler")
+                task.cancel()
+                await asyncio.gather(task, return_exceptions=True)
+                return None
+    finally:
+        if not task.done():
+            task.cancel()
+
+async def count_disconnect(stream, root=None):
+    """StreamingResponse 收到 http.disconnect 时会取消响应任务，CancelledError 沿生成器链传下去，
+    关闭上游 httpx 流并取消未完成的预处理任务；这里只记录没有正常结束的流"""
+    try:
+        async for chunk in stream:
+            yield chunk
+    except (asyncio.CancelledError, GeneratorExit):
+        logger.info("客户端已断开，停止流式输出")
+        CANCELLED_REQUESTS.inc(stage="stream")
+        if root is not None:
+            root.set_attribute("client_disconnected", True)
+        raise
+    finally:
+        await stream.aclose()
+
+async def traced_stream(stream, root):
+    error = None
+    try:
+        async for chunk in stream:
+            yield chunk
+    except Exception as e:
+        error = e
+        raise
+    finally:
+        tracer.end_trace(root, error)
+
 @app.post("/v1/chat/completions")
 async def chat_completions(
     request: ChatRequest,
+    http_request: Request,
     background_tasks: BackgroundTasks,
     api_key: str = Depends(verify_api_key)
 ):
+    root = tracer.start_trace("chat_completions", http_request.headers.get("traceparent"))
+    root.set_attribute("model", request.model)
+    root.set_attribute("stream", request.stream)
+    try:
+        response = await run_until_disconnected(handle_chat_completion(request, http_request), http_request)
+    except Exception as e:
+        tracer.end_trace(root, e)
+        raise
+    if response is None:
+        root.set_attribute("client_disconnected", True)
+        tracer.end_trace(root)
+        # 客户端已经断开，状态码只用于访问日志
+        return Response(status_code=499)
+    if isinstance(response, StreamingResponse):
+        # 流式响应在输出结束后才结束根 span
+        response.headers["traceparent"] = root.traceparent()
+        response.body_iterator = traced_stream(count_disconnect(response.body_iterator, root), root)
+    else:
+        tracer.end_trace(root)
+    return response
+
+async def handle_chat_completion(request: ChatRequest, http_request: Request):
+    cache_key, cached_response = await lookup_response_cache(request, http_request)
+    if cached_response is not None:
+        return cached_response
+
+    if not request.stream:
+        # 非流式请求直接调用上游的非流式接口，不经过 SSE 编解码
+        try:
+            return completion_response(await complete_chat(request), cache_key)
+        except HTTPException:
+            raise
+        except Exception as e:
+            logger.error(f"处理请求时出错: {str(e)}")
+            raise HTTPException(status_code=500, detail=str(e))
+
     if request.model == "openai":
         return StreamingResponse(
-            model_handler.call_openai(request.messages, request.stream),
+            cached_stream(
+                await model_handler.call_openai([message.model_dump() for message in request.messages]),
+                cache_key
+            ),
             media_type="text/event-stream"
         )
     elif request.model == "gemini":
         return StreamingResponse(
-            model_handler.call_gemini(request.messages, request.stream),
+            cached_stream(
+                await model_handler.call_gemini([message.model_dump() for message in request.messages]),
+                cache_key
+            ),
             media_type="text/event-stream"
         )
-    else:
+    elif request.model != settings.HYBRID_MODEL_NAME:
         raise HTTPException(status_code=400, detail=f"Model not supported: {request.model}")
-    try:
-        # 预处理消息
-        messages = await web_parser.preprocess_messages(request.messages)
-        
-        # 并行处理图片和搜索
-        image_content, search_results = await asyncio.gather(
-            process_images(messages),
-            perform_search_if_needed(messages)
+
+    # 图片只取出一次放入旁路缓冲，后续只有图片识别会读取原始数据，其余环节都使用纯文本消息
+    messages, images = ImageBuffer.detach([message.model_dump() for message in request.messages])
+    if images:
+        logger.opt(lazy=True).debug("请求包含图片: {}", lambda: sanitize_content(list(images.images.values())))
+    if settings.PIPELINE_EARLY_START:
+        # 立即建立 SSE 连接，预处理进度以 reasoning_content 形式推送
+        return StreamingResponse(
+            cached_stream(pipelined_stream(messages, images, request), cache_key),
+            media_type="text/event-stream"
         )
-        
-        # 准备发送给模型的消息
-        model_messages = prepare_model_messages(messages, image_content, search_results)
+
+    try:
+        model_messages = None
+        async for event, payload in enrich_messages(messages, images):
+            if event == "done":
+                model_messages = payload
         
         # 创建流式响应
         return StreamingResponse(
-            model_handler.stream_response(model_messages, request),
+            cached_stream(model_handler.stream_response(model_messages, request), cache_key),
             media_type="text/event-stream"
         )
         
@@ -104,19 +321,120 @@ async def chat_completions(
         logger.error(f"处理请求时出错: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
-async def process_images(messages):
-    if image_processor.has_new_images(messages):
-        images = image_processor.extract_last_images(messages)
-        image_descriptions = await asyncio.gather(*[
-            image_processor.process_image(img) for img in images
-        ])
-        return "\n".join(desc for desc in image_descriptions if desc)
-    return None
+async def complete_chat(request: ChatRequest) -> Dict[str, Any]:
+    """非流式处理一个请求并返回 chat.completion，供非流式接口和批处理共用"""
+    messages = [message.model_dump() for message in request.messages]
+    if request.model == "openai":
+        return await model_handler.call_openai(messages, stream=False)
+    if request.model == "gemini":
+        return await model_handler.call_gemini(messages, stream=False)
+    if request.model != settings.HYBRID_MODEL_NAME:
+        raise HTTPException(status_code=400, detail=f"Model not supported: {request.model}")
+
+    messages, images = ImageBuffer.detach(messages)
+    model_messages = None
+    async for event, payload in enrich_messages(messages, images):
+        if event == "done":
+            model_messages = payload
+    return await model_handler.complete_response(model_messages, request)
+
+async def enrich_messages(messages, images: ImageBuffer, deadline: Optional[float] = None):
+    """并行执行链接解析、图片识别和联网搜索，逐个产出 ("progress", 说明)，
+    最后产出 ("done", 发送给模型的消息)；给定 deadline（秒）时超时的任务会被取消，否则等待全部完成"""
+    tasks = {
+        asyncio.create_task(web_parser.preprocess_messages(messages)): "urls",
+        asyncio.create_task(process_images(images)): "images",
+        asyncio.create_task(perform_search_if_needed(messages)): "search"
+    }
+    results = {}
+    loop = asyncio.get_running_loop()
+    deadline_at = None if deadline is None else loop.time() + deadline
+    pending = set(tasks)
+    try:
+        yield "progress", "正在解析链接、识别图片并判断是否需要联网搜索…"
+        while pending:
+            timeout = None if deadline_at is None else deadline_at - loop.time()
+            if timeout is not None and timeout <= 0:
+                break
+            done, pending = await asyncio.wait(
+                pending, timeout=timeout, return_when=asyncio.FIRST_COMPLETED
+            )
+            for task in done:
+                name = tasks[task]
+                if task.exception():
+                    logger.error(f"预处理任务 {name} 失败: {str(task.exception())}")
+                    continue
+                results[name] = task.result()
+                # 链接解析总是返回消息列表，没有展开任何链接时不推送进度
+                if name == "urls" and results[name] == messages:
+                    continue
+                if results[name]:
+                    yield "progress", ENRICHMENT_PROGRESS[name]
+
+        if pending:
+            skipped = ", ".join(tasks[task] for task in pending)
+            logger.warning(f"预处理超时，跳过: {skipped}")
+            yield "progress", f"部分预处理超时，已跳过: {skipped}"
+    finally:
+        for task in pending:
+            task.cancel()
+
+    yield "done", prepare_model_messages(
+        results.get("urls") or messages,
+        results.get("images"),
+        results.get("search")
+    )
+
+async def pipelined_stream(messages, images: ImageBuffer, request):
+    completion_id = f"chatcmpl-{uuid.uuid4().hex}"
+    model_messages = None
+    # 只有流水线模式追求首字节时间，超过截止时间的预处理任务会被跳过
+    async for event, payload in enrich_messages(messages, images, settings.ENRICHMENT_DEADLINE):
+        if event == "done":
+            model_messages = payload
+            continue
+        yield format_sse_message({
+            "id": completion_id,
+            "object": "chat.completion.chunk",
+            "created": int(time.time()),
+            "model": settings.HYBRID_MODEL_NAME,
+            "choices": [{
+                "delta": {"reasoning_content": f"{payload}\n"},
+                "index": 0,
+                "finish_reason": None
+            }]
+        })
+
+    async for chunk in model_handler.stream_response(model_messages, request):
+        yield chunk
+
+async def process_images(images: ImageBuffer):
+    with tracer.span("process_images"):
+        latest = images.latest_images()
+        if latest:
+            image_descriptions = await asyncio.gather(*[
+                image_processor.process_image(image) for _, image in latest
+            ])
+            # 描述带上与消息中占位符相同的图片 ID，便于模型对应
+            return "\n".join(
+                f"{IMAGE_PLACEHOLDER.format(image_id=image_id)} {desc}"
+                for (image_id, _), desc in zip(latest, image_descriptions) if desc
+            )
+        return None
 
 async def perform_search_if_needed(messages):
-    if await model_handler.determine_if_search_needed(messages):
-        return await model_handler.perform_web_search(messages)
-    return None
+    with tracer.span("perform_search_if_needed") as span:
+        if await model_handler.determine_if_search_needed(messages):
+            if span is not None:
+                span.set_attribute("search", True)
+            return await model_handler.perform_web_search(messages)
+        return None
+
+ENRICHMENT_PROGRESS = {
+    "urls": "链接内容已获取",
+    "images": "图片识别完成",
+    "search": "联网搜索完成"
+}
 
 def prepare_model_messages(messages, image_content, search_results):
     return [
@@ -132,6 +450,17 @@ def prepare_model_messages(messages, image_content, search_results):
         {"role": "system", "content": settings.RELAY_PROMPT}
     ]
 
+@app.get("/metrics")
+async def get_metrics():
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4")
+
+@app.get("/cache/stats")
+async def get_cache_stats(api_key: str = Depends(verify_api_key)):
+    return JSONResponse(content={
+        "response": response_cache.stats(),
+        **model_handler.search_cache.stats()
+    })
+
 # 文件上传相关路由
 @app.post("/files/upload")
 async def upload_file(file: UploadFile = File(...)):
@@ -159,6 +488,80 @@ async def delete_file(filename: str):
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+# 批处理相关路由
+async def run_batch_request(body: Dict[str, Any]) -> Dict[str, Any]:
+    request = ChatRequest(**{**body, "stream": False})
+    cache_key, cached = await find_cached_entry(request, {})
+    if cached is not None:
+        return ResponseCache.build_completion(cached)
+    completion = await complete_chat(request)
+    if cache_key is not None:
+        response_cache.record_completion(cache_key, completion)
+    return completion
+
+def batch_upstreams(body: Dict[str, Any]) -> List[str]:
+    """批处理限速使用的上游地址；混合模型还会调用搜索模型，带图片时调用图片模型，多个阶段共用一个地址时只计一次"""
+    if body.get("model") == "openai":
+        return [settings.OPENAI_BASE_URL]
+    if body.get("model") == "gemini":
+        return [settings.PROXY_URL2]
+    upstreams = [settings.PROXY_URL, settings.PROXY_URL2, settings.PROXY_URL4]
+    has_images = any(
+        isinstance(message.get("content"), list)
+        and any(isinstance(part, dict) and part.get("type") == "image_url" for part in message["content"])
+        for message in body.get("messages") or []
+        if isinstance(message, dict)
+    )
+    if has_images:
+        upstreams.append(settings.PROXY_URL3)
+    return list(dict.fromkeys(upstreams))
+
+batch_runner = BatchRunner(run_batch_request, batch_upstreams)
+
+class BatchCreateRequest(BaseModel):
+    input_file: Optional[str] = None
+    requests: Optional[List[Dict[str, Any]]] = None
+
+@app.post("/v1/batches")
+async def create_batch(body: BatchCreateRequest, api_key: str = Depends(verify_api_key)):
+    """input_file 为通过 /files/upload 上传的 JSONL 文件名，也可以直接在 requests 中提供请求列表"""
+    if body.input_file:
+        input_path = file_handler.upload_dir / Path(body.input_file).name
+        if not input_path.is_file():
+            raise HTTPException(status_code=404, detail=f"文件 {body.input_file} 不存在")
+        job = await batch_runner.create(input_path=input_path)
+    elif body.requests:
+        job = await batch_runner.create(json.dumps(item, ensure_ascii=False) for item in body.requests)
+    else:
+        raise HTTPException(status_code=400, detail="需要提供 input_file 或 requests")
+    return JSONResponse(content=job)
+
+@app.get("/v1/batches")
+async def list_batches(api_key: str = Depends(verify_api_key)):
+    return JSONResponse(content={"data": await batch_runner.list()})
+
+@app.get("/v1/batches/{job_id}")
+async def get_batch(job_id: str, api_key: str = Depends(verify_api_key)):
+    job = await batch_runner.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"批处理任务 {job_id} 不存在")
+    return JSONResponse(content=job)
+
+@app.get("/v1/batches/{job_id}/output")
+async def get_batch_output(job_id: str, api_key: str = Depends(verify_api_key)):
+    """返回已完成部分的结果，任务执行中也可以下载"""
+    path = batch_runner.output_path(job_id)
+    if not path.is_file():
+        raise HTTPException(status_code=404, detail=f"批处理任务 {job_id} 暂无输出")
+    return FileResponse(path, media_type="application/jsonl", filename=f"{job_id}.jsonl")
+
+@app.post("/v1/batches/{job_id}/cancel")
+async def cancel_batch(job_id: str, api_key: str = Depends(verify_api_key)):
+    job = await batch_runner.cancel(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"批处理任务 {job_id} 不存在")
+    return JSONResponse(content=job)
+
 # 模型配置相关路由
 @app.post("/config/model")
 async def update_model_config(
@@ -167,21 +570,22 @@ async def update_model_config(
     base_url: Optional[str] = Form(None)
 ):
     try:
-        # 更新模型配置
+        # 更新模型配置，并通过状态存储同步到其他 worker
         if model_name == "deepseek_r1":
-            settings.DEEPSEEK_R1_API_KEY = api_key
+            values = {"DEEPSEEK_R1_API_KEY": api_key}
             if base_url:
-                settings.PROXY_URL = base_url
+                values["PROXY_URL"] = base_url
         elif model_name == "gemini":
-            settings.Model_output_API_KEY = api_key
+            values = {"Model_output_API_KEY": api_key}
             if base_url:
-                settings.PROXY_URL2 = base_url
+                values["PROXY_URL2"] = base_url
         elif model_name == "image":
-            settings.Image_Model_API_KEY = api_key
+            values = {"Image_Model_API_KEY": api_key}
             if base_url:
-                settings.PROXY_URL3 = base_url
+                values["PROXY_URL3"] = base_url
         else:
             raise HTTPException(status_code=400, detail=f"不支持的模型类型: {model_name}")
+        runtime_config.update(values)
             
         return JSONResponse(content={"message": f"模型 {model_name} 配置已更新"})
     except Exception as e:
@@ -1,8 +1,7 @@
 from typing import List, Dict, Any, Optional
 from pydantic import BaseModel
-import aiohttp
 from loguru import logger
-from config import Config
+from config.settings import Settings as Config
 
 class ModelResponse(BaseModel):
     choices: List[Dict[str, Any]]
@@ -15,6 +14,7 @@ class ModelHandler:
 
     async def call_deepseek_r1(self, messages: List[Dict[str, Any]], stream: bool = True) -> ModelResponse:
         """调用DeepSeek R1模型"""
+        import aiohttp
         async with aiohttp.ClientSession() as session:
             headers = {
                 "Authorization": f"Bearer {self.config.DEEPSEEK_R1_API_KEY}",
@@ -44,6 +44,7 @@ class ModelHandler:
 
     async def call_gemini(self, messages: List[Dict[str, Any]], stream: bool = True) -> ModelResponse:
         """调用Gemini模型"""
+        import aiohttp
         async with aiohttp.ClientSession() as session:
             headers = {
                 "Authorization": f"Bearer {self.config.Image_Model_API_KEY}",
@@ -73,6 +74,7 @@ class ModelHandler:
 
     async def call_google_search(self, messages: List[Dict[str, Any]], stream: bool = True) -> ModelResponse:
         """调用Google搜索模型"""
+        import aiohttp
         async with aiohttp.ClientSession() as session:
             headers = {
                 "Authorization": f"Bearer {self.config.GoogleSearch_API_KEY}",
@@ -0,0 +1,373 @@
+from typing import List, Dict, Any, Optional, Callable, Awaitable, Iterable, AsyncGenerator, Tuple, IO, Set
+from pathlib import Path
+import asyncio
+import json
+import shutil
+import time
+import uuid
+import httpx
+from loguru import logger
+from config.settings import settings
+from modules.metrics import BATCH_REQUESTS
+
+try:
+    import fcntl
+except ImportError:  # Windows 下没有 fcntl，不做跨进程的任务锁
+    fcntl = None
+
+# 任务状态：queued / running 的任务会在服务重启后继续执行
+ACTIVE_STATUSES = ("queued", "running")
+# 执行中的任务至多每隔这么多秒把进度写回 job.json
+PROGRESS_SAVE_INTERVAL = 1.0
+# 每次在线程中读取的输入字节数（按行取整）
+INPUT_READ_HINT = 64 * 1024
+
+class UpstreamLimiter:
+    """按固定间隔放行对某个上游的请求；收到 429 后在 Retry-After 期间暂停"""
+
+    def __init__(self, requests_per_minute: float):
+        self.interval = 60.0 / requests_per_minute if requests_per_minute else 0.0
+        self._next_at = 0.0
+        self._paused_until = 0.0
+
+    async def acquire(self) -> None:
+        now = time.monotonic()
+        start = max(now, self._next_at, self._paused_until)
+        self._next_at = start + self.interval
+        if start > now:
+            await asyncio.sleep(start - now)
+
+    def pause(self, seconds: float) -> None:
+        self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+
+class BatchRunner:
+    """离线批处理：输入和输出都是 JSONL 文件，每个任务一个目录，输出逐行追加，重启后跳过已完成的请求继续执行
+
+    process 接收一条请求体并返回 chat.completion；upstreams_for 返回该请求会调用的上游地址，用于限速。
+    concurrency 是整个进程所有任务合计的并发上限；文件读写都在线程中执行，不阻塞事件循环
+    """
+
+    def __init__(
+        self,
+        process: Callable[[Dict[str, Any]], Awaitable[Dict[str, Any]]],
+        upstreams_for: Callable[[Dict[str, Any]], Iterable[str]],
+        batch_dir: str = settings.BATCH_DIR,
+        concurrency: int = settings.BATCH_CONCURRENCY,
+        requests_per_minute: float = settings.BATCH_UPSTREAM_RPM,
+        max_retries: int = settings.BATCH_MAX_RETRIES,
+        retry_failed: bool = settings.BATCH_RETRY_FAILED
+    ):
+        self.process = process
+        self.upstreams_for = upstreams_for
+        self.batch_dir = Path(batch_dir)
+        self.batch_dir.mkdir(parents=True, exist_ok=True)
+        self.concurrency = concurrency
+        self.requests_per_minute = requests_per_minute
+        self.max_retries = max_retries
+        self.retry_failed = retry_failed
+        self._slots = asyncio.Semaphore(max(1, concurrency))
+        self._limiters: Dict[str, UpstreamLimiter] = {}
+        self._tasks: Dict[str, asyncio.Task] = {}
+        # 正在被 cancel() 取消的任务，执行任务的协程退出时写入 cancelled
+        self._cancelling: Set[str] = set()
+
+    async def create(self, lines: Iterable[str] = (), input_path: Optional[Path] = None) -> Dict[str, Any]:
+        """创建任务并立即开始执行；input_path 为上传的 JSONL 文件，否则使用 lines"""
+        job = await asyncio.to_thread(self._create, list(lines), input_path)
+        self._start(job)
+        return job
+
+    def _create(self, lines: List[str], input_path: Optional[Path]) -> Dict[str, Any]:
+        job_id = f"batch_{uuid.uuid4().hex}"
+        job_dir = self.batch_dir / job_id
+        job_dir.mkdir(parents=True)
+        # 输入文件复制到任务目录，原文件被删除后任务仍可恢复
+        if input_path is not None:
+            shutil.copyfile(input_path, job_dir / "input.jsonl")
+        else:
+            with open(job_dir / "input.jsonl", "w", encoding="utf-8") as f:
+                for line in lines:
+                    f.write(line.rstrip("\n") + "\n")
+        with open(job_dir / "input.jsonl", encoding="utf-8") as f:
+            total = sum(1 for line in f if line.strip())
+
+        job = {
+            "id": job_id,
+            "object": "batch",
+            "status": "queued",
+            "created_at": int(time.time()),
+            "completed_at": None,
+            "request_counts": {"total": total, "completed": 0, "failed": 0}
+        }
+        self._save(job)
+        return job
+
+    async def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        return await asyncio.to_thread(self._load, job_id)
+
+    def _load(self, job_id: str) -> Optional[Dict[str, Any]]:
+        path = self.batch_dir / Path(job_id).name / "job.json"
+        try:
+            return json.loads(path.read_text(encoding="utf-8"))
+        except FileNotFoundError:
+            return None
+
+    def output_path(self, job_id: str) -> Path:
+        return self.batch_dir / Path(job_id).name / "output.jsonl"
+
+    async def list(self) -> List[Dict[str, Any]]:
+        return await asyncio.to_thread(self._list)
+
+    def _list(self) -> List[Dict[str, Any]]:
+        jobs = [self._load(path.name) for path in self.batch_dir.iterdir() if path.is_dir()]
+        return sorted((job for job in jobs if job), key=lambda job: job["created_at"], reverse=True)
+
+    async def cancel(self, job_id: str) -> Optional[Dict[str, Any]]:
+        job = await self.get(job_id)
+        if job is None or job["status"] not in ACTIVE_STATUSES:
+            return job
+        task = self._tasks.get(job["id"])
+        if task is not None:
+            # 由任务退出时自己写入 cancelled 和最终进度，等它结束后再读取，不会被随后的保存覆盖
+            self._cancelling.add(job["id"])
+            try:
+                task.cancel()
+                await asyncio.gather(task, return_exceptions=True)
+            finally:
+                self._cancelling.discard(job["id"])
+            job = await self.get(job_id)
+        if job["status"] in ACTIVE_STATUSES:
+            # 任务不在本进程执行（或没拿到任务锁就已退出）
+            job["status"] = "cancelled"
+            job["completed_at"] = int(time.time())
+            await asyncio.to_thread(self._save, job)
+        return job
+
+    async def resume(self) -> None:
+        """服务启动时继续执行未完成的任务"""
+        for job in await self.list():
+            if job["status"] in ACTIVE_STATUSES and job["id"] not in self._tasks:
+                logger.info(f"恢复批处理任务 {job['id']}")
+                self._start(job)
+
+    async def shutdown(self) -> None:
+        """停止所有任务但保留 running 状态，重启后自动恢复"""
+        tasks = list(self._tasks.values())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    def _start(self, job: Dict[str, Any]) -> None:
+        task = asyncio.create_task(self._run(job))
+        self._tasks[job["id"]] = task
+        task.add_done_callback(lambda _: self._tasks.pop(job["id"], None))
+
+    def _save(self, job: Dict[str, Any]) -> None:
+        path = self.batch_dir / job["id"] / "job.json"
+        tmp_path = path.with_suffix(".tmp")
+        tmp_path.write_text(json.dumps(job, ensure_ascii=False), encoding="utf-8")
+        tmp_path.replace(path)
+
+    def _limiter(self, upstream: str) -> UpstreamLimiter:
+        if upstream not in self._limiters:
+            self._limiters[upstream] = UpstreamLimiter(self.requests_per_minute)
+        return self._limiters[upstream]
+
+    async def _run(self, job: Dict[str, Any]) -> None:
+        job_dir = self.batch_dir / job["id"]
+        lock = open(job_dir / "lock", "w")
+        if fcntl is not None:
+            try:
+                # 多 worker 部署时只有拿到锁的进程执行该任务，进程退出后锁自动释放
+                fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                lock.close()
+                return
+
+        input_file = output_file = lines = None
+        try:
+            done = await asyncio.to_thread(self._load_output, job_dir / "output.jsonl")
+            counts = job["request_counts"]
+            counts["completed"] = sum(1 for ok in done.values() if ok)
+            counts["failed"] = sum(1 for ok in done.values() if not ok)
+            job["status"] = "running"
+            await asyncio.to_thread(self._save, job)
+
+            input_file, output_file = await asyncio.to_thread(self._open_files, job_dir)
+            lines = self._read_lines(input_file)
+            read_lock = asyncio.Lock()
+            write_lock = asyncio.Lock()
+            last_saved = time.monotonic()
+            cancelled = False
+
+            async def next_item() -> Optional[Tuple[int, str]]:
+                # 所有 worker 共享同一个输入流，按需逐块读取
+                async with read_lock:
+                    try:
+                        return await lines.__anext__()
+                    except StopAsyncIteration:
+                        return None
+
+            async def worker() -> None:
+                nonlocal last_saved, cancelled
+                while not cancelled:
+                    item = await next_item()
+                    if item is None:
+                        return
+                    async with self._slots:
+                        record = await self._run_line(*item, done)
+                    if record is None:
+                        continue
+                    async with write_lock:
+                        await asyncio.to_thread(self._append, output_file, record)
+                    counts["failed" if record["error"] else "completed"] += 1
+                    if time.monotonic() - last_saved >= PROGRESS_SAVE_INTERVAL:
+                        last_saved = time.monotonic()
+                        # 任务可能已被其他 worker 进程取消
+                        if (await self.get(job["id"]))["status"] == "cancelled":
+                            cancelled = True
+                            return
+                        await asyncio.to_thread(self._save, job)
+
+            # 每个任务最多启动 concurrency 个 worker，实际并发由进程共享的 _slots 限制
+            await asyncio.gather(*[worker() for _ in range(max(1, self.concurrency))])
+
+            job["status"] = "completed"
+            job["completed_at"] = int(time.time())
+            logger.info(f"批处理任务 {job['id']} 完成: {counts}")
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"批处理任务 {job['id']} 失败: {str(e)}")
+            job["status"] = "failed"
+            job["completed_at"] = int(time.time())
+        finally:
+            if lines is not None:
+                await lines.aclose()
+            if job["id"] in self._cancelling:
+                job["status"] = "cancelled"
+                job["completed_at"] = int(time.time())
+                await asyncio.to_thread(self._save, job)
+            # 其他进程取消的任务保留 cancelled 状态
+            elif ((await self.get(job["id"])) or {}).get("status") != "cancelled":
+                await asyncio.to_thread(self._save, job)
+            await asyncio.to_thread(self._close_files, input_file, output_file, lock)
+
+    @staticmethod
+    def _open_files(job_dir: Path) -> Tuple[IO[str], IO[str]]:
+        input_file = open(job_dir / "input.jsonl", encoding="utf-8")
+        try:
+            return input_file, open(job_dir / "output.jsonl", "a", encoding="utf-8")
+        except Exception:
+            input_file.close()
+            raise
+
+    @staticmethod
+    def _close_files(*files: Optional[IO[str]]) -> None:
+        for f in files:
+            if f is not None:
+                f.close()
+
+    @staticmethod
+    async def _read_lines(input_file: IO[str]) -> AsyncGenerator[Tuple[int, str], None]:
+        """在线程中按块读取输入文件，逐个产出 (序号, 非空行)"""
+        index = 0
+        while True:
+            lines = await asyncio.to_thread(input_file.readlines, INPUT_READ_HINT)
+            if not lines:
+                return
+            for line in lines:
+                if line.strip():
+                    yield index, line
+                    index += 1
+
+    @staticmethod
+    def _append(output_file: IO[str], record: Dict[str, Any]) -> None:
+        output_file.write(json.dumps(record, ensure_ascii=False) + "\n")
+        output_file.flush()
+
+    async def _run_line(self, index: int, line: str, done: Dict[str, bool]) -> Optional[Dict[str, Any]]:
+        """执行一行输入，返回要写入输出文件的记录；已完成的请求返回 None
+        每行可以是 {"custom_id": ..., "body": {...}}，也可以直接是 /v1/chat/completions 的请求体"""
+        error = None
+        try:
+            item = json.loads(line)
+            if not isinstance(item, dict):
+                item, error = {}, "每行必须是一个 JSON 对象"
+        except ValueError as e:
+            item, error = {}, f"无效的 JSON: {str(e)}"
+        custom_id = str(item.get("custom_id") or f"request-{index}")
+        if custom_id in done:
+            return None
+        done[custom_id] = False
+
+        record: Dict[str, Any] = {
+            "id": f"batch_req_{uuid.uuid4().hex}",
+            "custom_id": custom_id,
+            "response": None,
+            "error": None
+        }
+        if error is None:
+            try:
+                completion = await self._call_with_retries(item.get("body", item))
+                record["response"] = {"status_code": 200, "body": completion}
+                done[custom_id] = True
+            except Exception as e:
+                error = str(e) or type(e).__name__
+        if error is not None:
+            record["error"] = {"message": error}
+        BATCH_REQUESTS.inc(outcome="error" if error is not None else "ok")
+        return record
+
+    async def _call_with_retries(self, body: Dict[str, Any]) -> Dict[str, Any]:
+        upstreams = list(self.upstreams_for(body))
+        attempt = 0
+        while True:
+            for upstream in upstreams:
+                await self._limiter(upstream).acquire()
+            try:
+                return await self.process(body)
+            except (httpx.HTTPStatusError, httpx.TransportError) as e:
+                attempt += 1
+                status = e.response.status_code if isinstance(e, httpx.HTTPStatusError) else None
+                if attempt > self.max_retries or (status is not None and status != 429 and status < 500):
+                    raise
+                delay = min(60.0, 2.0 ** attempt)
+                if status == 429:
+                    retry_after = e.response.headers.get("Retry-After", "")
+                    delay = float(retry_after) if retry_after.isdigit() else delay
+                    # 限流的上游暂停一段时间，其他 worker 对它的请求也会等待
+                    url = str(e.request.url)
+                    for upstream in upstreams:
+                        if url.startswith(upstream):
+                            self._limiter(upstream).pause(delay)
+                logger.warning(f"批处理请求失败，{delay:.0f} 秒后第 {attempt} 次重试: {str(e)}")
+                await asyncio.sleep(delay)
+
+    def _load_output(self, path: Path) -> Dict[str, bool]:
+        """读取已有输出，返回 custom_id -> 是否成功。
+        retry_failed 为 True 时从输出中删除失败的记录，这些请求会重新执行"""
+        done: Dict[str, bool] = {}
+        if not path.exists():
+            return done
+        with open(path, "rb+") as f:
+            data = f.read()
+            # 进程中断时可能留下半行，截掉后该请求会重新执行
+            end = data.rfind(b"\n") + 1
+            if end < len(data):
+                f.truncate(end)
+        kept: List[bytes] = []
+        for line in data[:end].splitlines():
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue
+            ok = record.get("error") is None
+            if ok or not self.retry_failed:
+                done[record["custom_id"]] = ok
+                kept.append(line)
+        if len(kept) < len(data[:end].splitlines()):
+            tmp_path = path.with_suffix(".tmp")
+            tmp_path.write_bytes(b"".join(line + b"\n" for line in kept))
+            tmp_path.replace(path)
+        return done
@@ -1,12 +1,21 @@
-import pandas as pd
-import mammoth
 from io import BytesIO
-import chardet
-from typing import Optional
+from typing import Optional, TYPE_CHECKING
+import importlib
 from loguru import logger
-import pdfplumber
+
+if TYPE_CHECKING:
+    import pandas as pd
+
+# 解析后端体积较大，首次解析对应类型的文件时才导入
+BACKENDS = ('pandas', 'mammoth', 'chardet', 'pdfplumber')
 
 class FileParser:
+    @staticmethod
+    def prewarm() -> None:
+        """预先导入全部解析后端，供启动时在后台线程调用"""
+        for name in BACKENDS:
+            importlib.import_module(name)
+
     @staticmethod
     def parse_file(file_type: str, file_content: bytes) -> Optional[str]:
         try:
@@ -26,27 +35,32 @@ class FileParser:
 
     @staticmethod
     def _parse_pdf(content: bytes) -> str:
+        import pdfplumber
         with pdfplumber.open(BytesIO(content)) as pdf:
             return '\n'.join(page.extract_text() for page in pdf.pages)
 
     @staticmethod
     def _parse_docx(content: bytes) -> str:
-        result = mammoth.extract_raw_text({'buffer': content})
+        import mammoth
+        result = mammoth.extract_raw_text(BytesIO(content))
         return result.value
 
     @staticmethod
     def _parse_excel(content: bytes) -> str:
+        import pandas as pd
         df = pd.read_excel(BytesIO(content))
         return FileParser._format_dataframe(df)
 
     @staticmethod
     def _parse_csv(content: bytes) -> str:
+        import chardet
+        import pandas as pd
         encoding = chardet.detect(content)['encoding'] or 'utf-8'
         df = pd.read_csv(BytesIO(content), encoding=encoding)
         return FileParser._format_dataframe(df)
 
     @staticmethod
-    def _format_dataframe(df: pd.DataFrame) -> str:
+    def _format_dataframe(df: 'pd.DataFrame') -> str:
         headers = ' | '.join(str(col) for col in df.columns)
         rows = [' | '.join(str(cell) for cell in row) for _, row in df.iterrows()]
         return f"表头:\n{headers}\n\n数据:\n" + '\n'.join(rows)
\ No newline at end of file
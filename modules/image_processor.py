@@ -1,16 +1,71 @@
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, Tuple
+import asyncio
 import httpx
+import time
 from loguru import logger
 from config.settings import settings
+from modules.metrics import STAGE_SECONDS, UPSTREAM_REQUESTS
+from modules.tracing import tracer
+from utils.logger import upstream_error_logger
+
+IMAGE_PLACEHOLDER = "[图片 {image_id}]"
+
+class ImageBuffer:
+    """请求内图片的旁路缓冲：按 ID 引用原始 image_url 片段（不复制 base64 数据），
+    消息中的图片替换为文本占位符，供只接收文本的模型使用"""
+
+    def __init__(self):
+        self.images: Dict[str, Dict[str, Any]] = {}
+        self.latest: List[str] = []
+
+    def __len__(self) -> int:
+        return len(self.images)
+
+    def __repr__(self) -> str:
+        return f"ImageBuffer({len(self.images)} images, {self.total_chars()} chars)"
+
+    def total_chars(self) -> int:
+        return sum(len(image.get('image_url', {}).get('url', '')) for image in self.images.values())
+
+    def latest_images(self) -> List[Tuple[str, Dict[str, Any]]]:
+        return [(image_id, self.images[image_id]) for image_id in self.latest]
+
+    @classmethod
+    def detach(cls, messages: List[Dict[str, Any]]) -> Tuple[List[Dict[str, Any]], "ImageBuffer"]:
+        """把消息中的图片取出放入缓冲区，返回 (纯文本消息, 缓冲区)；不修改传入的消息"""
+        buffer = cls()
+        text_messages = []
+        for index, message in enumerate(messages):
+            content = message.get('content')
+            if not isinstance(content, list) or not any(item.get('type') == 'image_url' for item in content):
+                text_messages.append(message)
+                continue
+            texts = []
+            for item in content:
+                if item.get('type') == 'image_url':
+                    image_id = f"img-{len(buffer.images) + 1}"
+                    buffer.images[image_id] = item
+                    if index == len(messages) - 1:
+                        buffer.latest.append(image_id)
+                    texts.append(IMAGE_PLACEHOLDER.format(image_id=image_id))
+                elif item.get('type') == 'text':
+                    texts.append(item.get('text', ''))
+            text_messages.append({**message, 'content': "\n".join(texts)})
+        return text_messages, buffer
 
 class ImageProcessor:
     def __init__(self):
         self.client = httpx.AsyncClient(timeout=30.0)
         
     async def process_image(self, image_message: Dict[str, Any]) -> Optional[str]:
+        started = time.perf_counter()
+        model = ""
+        outcome = "error"
+        span = tracer.start_span("upstream image")
         try:
+            model = settings.Image_MODEL
             request_body = {
-                "model": settings.Image_MODEL,
+                "model": model,
                 "messages": [
                     {"role": "system", "content": settings.Image_Model_PROMPT},
                     {"role": "user", "content": [image_message]}
@@ -25,36 +80,25 @@ class ImageProcessor:
                 json=request_body,
                 headers={
                     "Authorization": f"Bearer {settings.Image_Model_API_KEY}",
-                    "Content-Type": "application/json"
+                    "Content-Type": "application/json",
+                    **tracer.headers(span)
                 }
             )
             response.raise_for_status()
-            return response.json()["choices"][0]["message"]["content"]
+            description = response.json()["choices"][0]["message"]["content"]
+            outcome = "ok"
+            return description
             
+        except asyncio.CancelledError:
+            outcome = "cancelled"
+            raise
         except Exception as e:
-            logger.error(f"图片处理错误: {str(e)}")
+            upstream_error_logger.error(f"image:{type(e).__name__}", f"图片处理错误: {str(e)}")
+            if span is not None:
+                span.set_error(e)
             return None
-            
-    @staticmethod
-    def has_new_images(messages: List[Dict[str, Any]]) -> bool:
-        if not messages:
-            return False
-        last_message = messages[-1]
-        return (
-            isinstance(last_message.get('content'), list) and
-            any(item.get('type') == 'image_url' for item in last_message['content'])
-        )
-        
-    @staticmethod
-    def extract_last_images(messages: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
-        if not messages:
-            return []
-            
-        last_message = messages[-1]
-        if not isinstance(last_message.get('content'), list):
-            return []
-            
-        return [
-            item for item in last_message['content']
-            if item.get('type') == 'image_url'
-        ]
\ No newline at end of file
+        finally:
+            if span is not None:
+                span.end()
+            STAGE_SECONDS.observe(time.perf_counter() - started, stage="image_description", upstream="image")
+            UPSTREAM_REQUESTS.inc(model=model or "", upstream="image", outcome=outcome)
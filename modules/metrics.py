@@ -0,0 +1,132 @@
+from typing import Dict, Tuple, List, Iterator
+from bisect import bisect_left
+from contextlib import contextmanager
+import time
+
+# 默认耗时分桶（秒），覆盖从毫秒级 token 间隔到数十秒的整段流
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+def _format_labels(names: Tuple[str, ...], values: Tuple[str, ...], extra: str = '') -> str:
+    pairs = [f'{name}="{value}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+class _Metric:
+    kind = ''
+
+    def __init__(self, name: str, description: str, labels: Tuple[str, ...] = ()):
+        self.name = name
+        self.description = description
+        self.label_names = labels
+
+    def _key(self, labels: Dict[str, str]) -> Tuple[str, ...]:
+        return tuple(str(labels.get(name, '')) for name in self.label_names)
+
+    def header(self) -> List[str]:
+        return [f'# HELP {self.name} {self.description}', f'# TYPE {self.name} {self.kind}']
+
+class Counter(_Metric):
+    kind = 'counter'
+
+    def __init__(self, name: str, description: str, labels: Tuple[str, ...] = ()):
+        super().__init__(name, description, labels)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1.0, **labels: str) -> None:
+        key = self._key(labels)
+        self._values[key] = self._values.get(key, 0.0) + amount
+
+    def render(self) -> List[str]:
+        return self.header() + [
+            f'{self.name}{_format_labels(self.label_names, key)} {value}'
+            for key, value in self._values.items()
+        ]
+
+class Gauge(Counter):
+    kind = 'gauge'
+
+    def dec(self, amount: float = 1.0, **labels: str) -> None:
+        self.inc(-amount, **labels)
+
+class Histogram(_Metric):
+    kind = 'histogram'
+
+    def __init__(self, name: str, description: str, labels: Tuple[str, ...] = (), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, description, labels)
+        self.buckets = tuple(buckets)
+        # 每组标签对应 [各分桶计数..., 总和, 总次数]
+        self._values: Dict[Tuple[str, ...], List[float]] = {}
+
+    def observe(self, value: float, **labels: str) -> None:
+        key = self._key(labels)
+        series = self._values.get(key)
+        if series is None:
+            series = self._values[key] = [0] * (len(self.buckets) + 2)
+        index = bisect_left(self.buckets, value)
+        if index < len(self.buckets):
+            series[index] += 1
+        series[-2] += value
+        series[-1] += 1
+
+    @contextmanager
+    def time(self, **labels: str) -> Iterator[None]:
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def render(self) -> List[str]:
+        lines = self.header()
+        for key, series in self._values.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets, series):
+                cumulative += count
+                labels = _format_labels(self.label_names, key, f'le="{bound}"')
+                lines.append(f'{self.name}_bucket{labels} {cumulative}')
+            labels = _format_labels(self.label_names, key, 'le="+Inf"')
+            lines.append(f'{self.name}_bucket{labels} {series[-1]}')
+            lines.append(f'{self.name}_sum{_format_labels(self.label_names, key)} {series[-2]}')
+            lines.append(f'{self.name}_count{_format_labels(self.label_names, key)} {series[-1]}')
+        return lines
+
+STAGE_SECONDS = Histogram(
+    'modelmix_stage_seconds',
+    '各处理阶段耗时（url_fetch / image_description / search_decision / web_search / upstream_ttft / upstream_stream / upstream_complete）',
+    ('stage', 'upstream')
+)
+INTER_TOKEN_SECONDS = Histogram(
+    'modelmix_inter_token_seconds',
+    '上游流式响应相邻两个分片之间的间隔',
+    ('upstream',),
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+)
+UPSTREAM_REQUESTS = Counter(
+    'modelmix_upstream_requests_total',
+    '按模型、上游和结果（ok / error / cache_hit / cancelled）统计的上游调用次数',
+    ('model', 'upstream', 'outcome')
+)
+INFLIGHT_STREAMS = Gauge(
+    'modelmix_inflight_streams',
+    '正在进行中的流式响应数'
+)
+INFLIGHT_STREAMS.inc(0)
+CANCELLED_REQUESTS = Counter(
+    'modelmix_cancelled_requests_total',
+    '客户端断开后被取消的请求数（stage 为 handler 表示预处理或非流式调用阶段，stream 表示流式输出阶段）',
+    ('stage',)
+)
+BATCH_REQUESTS = Counter(
+    'modelmix_batch_requests_total',
+    '批处理任务中按结果统计的请求数',
+    ('outcome',)
+)
+
+REGISTRY = (STAGE_SECONDS, INTER_TOKEN_SECONDS, UPSTREAM_REQUESTS, INFLIGHT_STREAMS, CANCELLED_REQUESTS, BATCH_REQUESTS)
+
+def render_metrics() -> str:
+    lines: List[str] = []
+    for metric in REGISTRY:
+        lines.extend(metric.render())
+    return '\n'.join(lines) + '\n'
@@ -1,76 +1,108 @@
-from typing import List, Dict, Any, Optional, AsyncGenerator
+from typing import List, Dict, Any, Optional, AsyncGenerator, Tuple, Union
 import httpx
 import json
 import asyncio
+import time
+import uuid
 from loguru import logger
 from config.settings import settings
-from models import ModelResponse  # Ensure ModelResponse is imported from models
+from modules.search_cache import SearchCache
+from modules.metrics import STAGE_SECONDS, INTER_TOKEN_SECONDS, UPSTREAM_REQUESTS, INFLIGHT_STREAMS
+from modules.tracing import tracer, Span
+from utils.logger import upstream_error_logger
+from utils.helpers import format_sse_message
+
+# 输出模型数据块的缓冲上限；推理尚未结束时队列写满，投机启动的输出流随之暂停读取
+OUTPUT_QUEUE_MAXSIZE = 256
 
 class ModelHandler:
     def __init__(self):
         self.client = httpx.AsyncClient(timeout=30.0)
+        self.search_cache = SearchCache()
     
-    async def call_openai(self, messages: List[Dict[str, Any]], stream: bool = True) -> ModelResponse:
-        """调用OpenAI模型，并支持链式思考（chain-of-thought）"""
+    async def call_openai(
+        self,
+        messages: List[Dict[str, Any]],
+        stream: bool = True
+    ) -> Union[Dict[str, Any], AsyncGenerator[str, None]]:
+        """调用OpenAI模型，并支持链式思考（chain-of-thought）；
+        stream 为 True 时返回 SSE 文本生成器，否则返回 chat.completion 对象"""
         # Prepend the chain-of-thought reasoning prompt
-        new_messages = list(messages)
-        new_messages.insert(0, {"role": "system", "content": settings.OPENAI_THINKING_PROMPT})
-        
-        async with httpx.AsyncClient() as client:
-            headers = {
-                "Authorization": f"Bearer {settings.OPENAI_API_KEY}",
-                "Content-Type": "application/json"
-            }
-            payload = {
-                "model": settings.OPENAI_MODEL,
-                "messages": new_messages,
-                "stream": stream,
-                "max_tokens": settings.OPENAI_MAX_TOKENS,
-                "temperature": settings.OPENAI_TEMPERATURE
-            }
-            try:
-                async with client.post(
-                    f"{settings.OPENAI_BASE_URL}/chat/completions",
-                    headers=headers,
-                    json=payload
-                ) as response:
-                    if stream:
-                        return response
-                    else:
-                        data = await response.json()
-                        return ModelResponse(**data)
-            except Exception as e:
-                logger.error(f"OpenAI调用失败: {str(e)}")
-                raise
-    
-    async def call_custom_model(self, messages: List[Dict[str, Any]], stream: bool = True) -> ModelResponse:
-        """调用自定义模型"""
-        async with httpx.AsyncClient() as client:
-            headers = {
-                "Authorization": f"Bearer {settings.CUSTOM_MODEL_API_KEY}",
-                "Content-Type": "application/json"
-            }
-            payload = {
-                "model": settings.CUSTOM_MODEL_NAME,
-                "messages": messages,
-                "stream": stream
-            }
-            try:
-                async with client.post(
-                    f"{settings.CUSTOM_MODEL_BASE_URL}/chat/completions",
-                    headers=headers,
-                    json=payload
-                ) as response:
-                    if stream:
-                        return response
-                    else:
-                        data = await response.json()
-                        return ModelResponse(**data)
-            except Exception as e:
-                logger.error(f"自定义模型调用失败: {str(e)}")
-                raise
+        payload = {
+            "model": settings.OPENAI_MODEL,
+            "messages": [{"role": "system", "content": settings.OPENAI_THINKING_PROMPT}, *messages],
+            "max_tokens": settings.OPENAI_MAX_TOKENS,
+            "temperature": settings.OPENAI_TEMPERATURE
+        }
+        if stream:
+            return self._relay_stream(
+                "openai", settings.OPENAI_BASE_URL, settings.OPENAI_API_KEY, payload, "/chat/completions"
+            )
+        try:
+            return await self._complete(
+                "openai", settings.OPENAI_BASE_URL, settings.OPENAI_API_KEY, payload, path="/chat/completions"
+            )
+        except Exception as e:
+            logger.error(f"OpenAI调用失败: {str(e)}")
+            raise
     
+    async def call_gemini(
+        self,
+        messages: List[Dict[str, Any]],
+        stream: bool = True
+    ) -> Union[Dict[str, Any], AsyncGenerator[str, None]]:
+        """直接调用输出模型（/config/model 中的 gemini），不经过思考模型；
+        stream 为 True 时返回 SSE 文本生成器，否则返回 chat.completion 对象"""
+        payload = {
+            "model": settings.Model_output_MODEL,
+            "messages": messages,
+            "max_tokens": settings.Model_output_MAX_TOKENS,
+            "temperature": settings.Model_output_TEMPERATURE
+        }
+        if stream:
+            return self._relay_stream("output", settings.PROXY_URL2, settings.Model_output_API_KEY, payload)
+        try:
+            return await self._complete("output", settings.PROXY_URL2, settings.Model_output_API_KEY, payload)
+        except Exception as e:
+            logger.error(f"Gemini调用失败: {str(e)}")
+            raise
+
+    async def call_custom_model(
+        self,
+        messages: List[Dict[str, Any]],
+        stream: bool = True
+    ) -> Union[Dict[str, Any], AsyncGenerator[str, None]]:
+        """调用自定义模型；stream 为 True 时返回 SSE 文本生成器，否则返回 chat.completion 对象"""
+        payload = {
+            "model": settings.CUSTOM_MODEL_NAME,
+            "messages": messages
+        }
+        if stream:
+            return self._relay_stream(
+                "custom", settings.CUSTOM_MODEL_BASE_URL, settings.CUSTOM_MODEL_API_KEY, payload, "/chat/completions"
+            )
+        try:
+            return await self._complete(
+                "custom", settings.CUSTOM_MODEL_BASE_URL, settings.CUSTOM_MODEL_API_KEY, payload, path="/chat/completions"
+            )
+        except Exception as e:
+            logger.error(f"自定义模型调用失败: {str(e)}")
+            raise
+
     async def determine_if_search_needed(self, messages: List[Dict[str, Any]]) -> bool:
+        cache = self.search_cache
+        if cache.prefilter(messages) is False:
+            cache.decision_stats.skipped += 1
+            return False
+
+        key = cache.decision_key(messages)
+        cached = await cache.decisions.get(key)
+        if cached is not None:
+            cache.decision_stats.hits += 1
+            return cached
+
+        started = time.perf_counter()
+        span = tracer.start_span("upstream search_decision")
         try:
             response = await self.client.post(
                 f"{settings.PROXY_URL4}/v1/chat/completions",
@@ -86,17 +118,27 @@ class ModelHandler:
                 },
                 headers={
                     "Authorization": f"Bearer {settings.GoogleSearch_API_KEY}",
-                    "Content-Type": "application/json"
+                    "Content-Type": "application/json",
+                    **tracer.headers(span)
                 }
             )
             response.raise_for_status()
-            decision = response.json()["choices"][0]["message"]["content"].strip().lower()
-            return decision == "yes"
+            decision = response.json()["choices"][0]["message"]["content"].strip().lower() == "yes"
+            cache.decisions.set(key, decision)
+            cache.decision_stats.record_miss(time.perf_counter() - started)
+            self._record_call("search_decision", "search", started, "ok", span)
+            return decision
+        except asyncio.CancelledError:
+            self._record_call("search_decision", "search", started, "cancelled", span)
+            raise
         except Exception as e:
-            logger.error(f"判断是否需要搜索时出错: {str(e)}")
+            upstream_error_logger.error(f"search_decision:{type(e).__name__}", f"判断是否需要搜索时出错: {str(e)}")
+            self._record_call("search_decision", "search", started, "error", span, e)
             return False
             
     async def perform_web_search(self, messages: List[Dict[str, Any]]) -> Optional[str]:
+        search_started = time.perf_counter()
+        span = tracer.start_span("upstream web_search")
         try:
             # 获取搜索关键词
             response = await self.client.post(
@@ -113,13 +155,23 @@ class ModelHandler:
                 },
                 headers={
                     "Authorization": f"Bearer {settings.GoogleSearch_API_KEY}",
-                    "Content-Type": "application/json"
+                    "Content-Type": "application/json",
+                    **tracer.headers(span)
                 }
             )
             response.raise_for_status()
             search_terms = response.json()["choices"][0]["message"]["content"]
-            
+
+            cache = self.search_cache
+            terms_key = cache.normalize_terms(search_terms)
+            cached = await cache.results.get(terms_key)
+            if cached is not None:
+                cache.result_stats.hits += 1
+                self._record_call("web_search", "search", search_started, "cache_hit", span)
+                return cached
+
             # 执行搜索
+            started = time.perf_counter()
             search_response = await self.client.post(
                 f"{settings.PROXY_URL4}/v1/chat/completions",
                 json={
@@ -151,82 +203,486 @@ class ModelHandler:
                 },
                 headers={
                     "Authorization": f"Bearer {settings.GoogleSearch_API_KEY}",
-                    "Content-Type": "application/json"
+                    "Content-Type": "application/json",
+                    **tracer.headers(span)
                 }
             )
             search_response.raise_for_status()
-            return search_response.json()["choices"][0]["message"]["content"]
+            result = search_response.json()["choices"][0]["message"]["content"]
+            cache.results.set(terms_key, result)
+            cache.result_stats.record_miss(time.perf_counter() - started)
+            self._record_call("web_search", "search", search_started, "ok", span)
+            return result
+        except asyncio.CancelledError:
+            self._record_call("web_search", "search", search_started, "cancelled", span)
+            raise
         except Exception as e:
-            logger.error(f"执行网络搜索时出错: {str(e)}")
+            upstream_error_logger.error(f"web_search:{type(e).__name__}", f"执行网络搜索时出错: {str(e)}")
+            self._record_call("web_search", "search", search_started, "error", span, e)
             return None
+
+    @staticmethod
+    def _record_call(
+        stage: str,
+        upstream: str,
+        started: float,
+        outcome: str,
+        span: Optional[Span] = None,
+        error: Optional[Exception] = None
+    ) -> None:
+        STAGE_SECONDS.observe(time.perf_counter() - started, stage=stage, upstream=upstream)
+        UPSTREAM_REQUESTS.inc(
+            model=settings.GoogleSearch_MODEL or "", upstream=upstream, outcome=outcome
+        )
+        if span is not None:
+            span.set_attribute("outcome", outcome)
+            if error is not None:
+                span.set_error(error)
+            span.end()
             
+    async def _stream_chunks(
+        self,
+        upstream: str,
+        base_url: str,
+        api_key: str,
+        payload: Dict[str, Any],
+        parent_span: Optional[Span] = None,
+        path: str = "/v1/chat/completions"
+    ) -> AsyncGenerator[Dict[str, Any], None]:
+        """流式调用上游模型，逐个产出解析后的 SSE 数据块，并记录首 token、分片间隔和总耗时"""
+        started = time.perf_counter()
+        last_chunk = None
+        outcome = "ok"
+        span = parent_span.child(f"upstream {upstream}", model=payload.get("model") or "") if parent_span else None
+        chunks = self._iter_sse(base_url, api_key, payload, tracer.headers(span), path)
+        try:
+            async for data in chunks:
+                now = time.perf_counter()
+                if last_chunk is None:
+                    STAGE_SECONDS.observe(now - started, stage="upstream_ttft", upstream=upstream)
+                    if span is not None:
+                        span.set_attribute("ttft_ms", round((now - started) * 1000, 1))
+                else:
+                    INTER_TOKEN_SECONDS.observe(now - last_chunk, upstream=upstream)
+                last_chunk = now
+                yield data
+        except asyncio.CancelledError:
+            # 客户端断开后整个请求被取消，httpx 流在 finally 中关闭
+            outcome = "cancelled"
+            raise
+        except Exception as e:
+            outcome = "error"
+            if span is not None:
+                span.set_error(e)
+            raise
+        finally:
+            await chunks.aclose()
+            if span is not None:
+                span.end()
+            STAGE_SECONDS.observe(time.perf_counter() - started, stage="upstream_stream", upstream=upstream)
+            UPSTREAM_REQUESTS.inc(model=payload.get("model") or "", upstream=upstream, outcome=outcome)
+
+    async def _iter_sse(
+        self,
+        base_url: str,
+        api_key: str,
+        payload: Dict[str, Any],
+        extra_headers: Optional[Dict[str, str]] = None,
+        path: str = "/v1/chat/completions"
+    ) -> AsyncGenerator[Dict[str, Any], None]:
+        async with self.client.stream(
+            "POST",
+            f"{base_url}{path}",
+            json={**payload, "stream": True},
+            headers={
+                "Authorization": f"Bearer {api_key}",
+                "Content-Type": "application/json",
+                **(extra_headers or {})
+            }
+        ) as response:
+            response.raise_for_status()
+            async for data in self._parse_sse(response):
+                yield data
+
+    @staticmethod
+    async def _parse_sse(response: httpx.Response) -> AsyncGenerator[Dict[str, Any], None]:
+        async for line in response.aiter_lines():
+            if not line.startswith("data: "):
+                continue
+            data = line[6:].strip()
+            if data == "[DONE]":
+                break
+            yield json.loads(data)
+
+    async def _complete(
+        self,
+        upstream: str,
+        base_url: str,
+        api_key: str,
+        payload: Dict[str, Any],
+        parent_span: Optional[Span] = None,
+        path: str = "/v1/chat/completions"
+    ) -> Dict[str, Any]:
+        """非流式调用上游模型，返回 chat.completion 对象；上游只会流式返回时把 SSE 折叠为完整回答"""
+        started = time.perf_counter()
+        outcome = "error"
+        span = parent_span.child(f"upstream {upstream}", model=payload.get("model") or "") if parent_span else None
+        try:
+            async with self.client.stream(
+                "POST",
+                f"{base_url}{path}",
+                json={**payload, "stream": False},
+                headers={
+                    "Authorization": f"Bearer {api_key}",
+                    "Content-Type": "application/json",
+                    **tracer.headers(span)
+                },
+                # 连接等阶段沿用客户端的超时，只放宽等待完整回答的读取超时
+                timeout=httpx.Timeout(self.client.timeout.connect, read=settings.COMPLETION_READ_TIMEOUT)
+            ) as response:
+                response.raise_for_status()
+                if response.headers.get("content-type", "").startswith("text/event-stream"):
+                    if span is not None:
+                        span.set_attribute("folded", True)
+                    completion = await self._fold_sse(response)
+                else:
+                    completion = json.loads(await response.aread())
+            outcome = "ok"
+            return completion
+        except asyncio.CancelledError:
+            outcome = "cancelled"
+            raise
+        except Exception as e:
+            if span is not None:
+                span.set_error(e)
+            raise
+        finally:
+            if span is not None:
+                span.end()
+            STAGE_SECONDS.observe(time.perf_counter() - started, stage="upstream_complete", upstream=upstream)
+            UPSTREAM_REQUESTS.inc(model=payload.get("model") or "", upstream=upstream, outcome=outcome)
+
+    @classmethod
+    async def _fold_sse(cls, response: httpx.Response) -> Dict[str, Any]:
+        """把 SSE 分片折叠为 chat.completion 对象，分片先收集到列表，最后一次性拼接"""
+        content_parts: List[str] = []
+        reasoning_parts: List[str] = []
+        completion: Dict[str, Any] = {}
+        finish_reason = None
+        async for data in cls._parse_sse(response):
+            if not completion:
+                completion = {key: data[key] for key in ("id", "created", "model") if key in data}
+            if data.get("usage"):
+                completion["usage"] = data["usage"]
+            if not data.get("choices"):
+                continue
+            choice = data["choices"][0]
+            delta = choice.get("delta") or {}
+            if delta.get("content"):
+                content_parts.append(delta["content"])
+            if delta.get("reasoning_content"):
+                reasoning_parts.append(delta["reasoning_content"])
+            finish_reason = choice.get("finish_reason") or finish_reason
+
+        message = {"role": "assistant", "content": "".join(content_parts)}
+        if reasoning_parts:
+            message["reasoning_content"] = "".join(reasoning_parts)
+        return {
+            **completion,
+            "object": "chat.completion",
+            "choices": [{"index": 0, "message": message, "finish_reason": finish_reason or "stop"}]
+        }
+
+    async def _relay_stream(
+        self,
+        upstream: str,
+        base_url: str,
+        api_key: str,
+        payload: Dict[str, Any],
+        path: str = "/v1/chat/completions"
+    ) -> AsyncGenerator[str, None]:
+        """单模型流式转发：把上游数据块重新编码为 SSE 文本"""
+        span = tracer.start_span(f"relay {upstream}")
+        chunks = self._stream_chunks(upstream, base_url, api_key, payload, span, path)
+        INFLIGHT_STREAMS.inc()
+        try:
+            async for data in chunks:
+                yield format_sse_message(data)
+            yield "data: [DONE]\n\n"
+        except Exception as e:
+            upstream_error_logger.error(f"{upstream}:{type(e).__name__}", f"{upstream} 流式调用失败: {str(e)}")
+            if span is not None:
+                span.set_error(e)
+            yield "data: {\"error\": \"All models failed\"}\n\n"
+        finally:
+            INFLIGHT_STREAMS.dec()
+            await chunks.aclose()
+            if span is not None:
+                span.end()
+
+    @staticmethod
+    async def _pump(stream: AsyncGenerator[Dict[str, Any], None], queue: asyncio.Queue) -> None:
+        """把上游数据块转存到队列，结束时放入 None，出错时放入异常"""
+        try:
+            async for data in stream:
+                await queue.put(data)
+            await queue.put(None)
+        except Exception as e:
+            await queue.put(e)
+        finally:
+            await stream.aclose()
+
+    @staticmethod
+    def _split_reasoning(delta: Dict[str, Any], state: Dict[str, Any]) -> Tuple[str, str]:
+        """拆分思考内容和正文，兼容 reasoning_content 字段和 <think> 标签两种格式"""
+        reasoning = delta.get("reasoning_content") or ""
+        content = delta.get("content") or ""
+        if content and not state["seen_content"] and content.lstrip().startswith("<think>"):
+            state["in_think"] = True
+            content = content.lstrip()[len("<think>"):]
+        if state["in_think"]:
+            if "</think>" in content:
+                thought, content = content.split("</think>", 1)
+                reasoning += thought
+                state["in_think"] = False
+            else:
+                reasoning += content
+                content = ""
+        if content:
+            state["seen_content"] = True
+        return reasoning, content
+
+    @staticmethod
+    def _thinking_payload(messages: List[Dict[str, Any]]) -> Dict[str, Any]:
+        return {
+            "model": settings.DEEPSEEK_R1_MODEL,
+            "messages": messages,
+            "max_tokens": settings.DEEPSEEK_R1_MAX_TOKENS,
+            "temperature": settings.DEEPSEEK_R1_TEMPERATURE
+        }
+
+    @staticmethod
+    def _output_payload(messages: List[Dict[str, Any]], reasoning: str, request: Any) -> Dict[str, Any]:
+        output_messages = list(messages)
+        if reasoning:
+            output_messages.append({
+                "role": "system",
+                "content": f"{settings.OUTPUT_REASONING_PROMPT}{reasoning}"
+            })
+        max_tokens = getattr(request, "max_tokens", None)
+        temperature = getattr(request, "temperature", None)
+        return {
+            "model": settings.Model_output_MODEL,
+            "messages": output_messages,
+            "max_tokens": max_tokens or settings.Model_output_MAX_TOKENS,
+            "temperature": settings.Model_output_TEMPERATURE if temperature is None else temperature
+        }
+
+    def _start_output_stage(
+        self,
+        messages: List[Dict[str, Any]],
+        reasoning: str,
+        request: Any,
+        span: Optional[Span] = None
+    ) -> Tuple[asyncio.Task, asyncio.Queue]:
+        queue: asyncio.Queue = asyncio.Queue(maxsize=OUTPUT_QUEUE_MAXSIZE)
+        stream = self._stream_chunks(
+            "output",
+            settings.PROXY_URL2,
+            settings.Model_output_API_KEY,
+            self._output_payload(messages, reasoning, request),
+            span
+        )
+        return asyncio.create_task(self._pump(stream, queue)), queue
+
     async def stream_response(
         self,
         messages: List[Dict[str, Any]],
         request: Any
     ) -> AsyncGenerator[str, None]:
+        """两阶段流式响应：先转发思考模型的推理过程，推理结束后由输出模型生成正文"""
+        completion_id = f"chatcmpl-{uuid.uuid4().hex}"
+        created = int(time.time())
+        started = time.perf_counter()
+        timings: Dict[str, float] = {}
+
+        def chunk(delta: Dict[str, Any], finish_reason: Optional[str] = None) -> str:
+            return format_sse_message({
+                "id": completion_id,
+                "object": "chat.completion.chunk",
+                "created": created,
+                "model": settings.HYBRID_MODEL_NAME,
+                "choices": [{
+                    "delta": delta,
+                    "index": 0,
+                    "finish_reason": finish_reason
+                }]
+            })
+
+        def mark(stage: str) -> None:
+            timings.setdefault(stage, round(time.perf_counter() - started, 3))
+
+        span = tracer.start_span("stream_response")
+        reasoning_parts: List[str] = []
+        reasoning_length = 0
+        output_task = None
+        speculative_reasoning = None
+        state = {"in_think": False, "seen_content": False}
+        thinking = self._stream_chunks(
+            "thinking",
+            settings.PROXY_URL,
+            settings.DEEPSEEK_R1_API_KEY,
+            self._thinking_payload(messages),
+            span
+        )
+        INFLIGHT_STREAMS.inc()
         try:
-            async with httpx.AsyncClient() as client:
-                async with client.stream(
-                    "POST",
-                    f"{settings.PROXY_URL}/v1/chat/completions",
-                    json={
-                        "model": settings.DEEPSEEK_R1_MODEL,
-                        "messages": messages,
-                        "max_tokens": settings.DEEPSEEK_R1_MAX_TOKENS,
-                        "temperature": settings.DEEPSEEK_R1_TEMPERATURE,
-                        "stream": True
-                    },
-                    headers={
-                        "Authorization": f"Bearer {settings.DEEPSEEK_R1_API_KEY}",
-                        "Content-Type": "application/json"
-                    }
-                ) as response:
-                    async for line in response.aiter_lines():
-                        if line.startswith("data: "):
-                            if line.strip() == "data: [DONE]":
-                                yield line + "\n"
-                                continue
-                                
-                            data = json.loads(line[6:])
-                            # 转换为OpenAI格式
-                            formatted_data = {
-                                "id": data.get("id"),
-                                "object": "chat.completion.chunk",
-                                "created": data.get("created"),
-                                "model": settings.HYBRID_MODEL_NAME,
-                                "choices": [{
-                                    "delta": {
-                                        "content": data["choices"][0]["delta"].get("content", "")
-                                    },
-                                    "index": 0,
-                                    "finish_reason": data["choices"][0].get("finish_reason")
-                                }]
-                            }
-                            yield f"data: {json.dumps(formatted_data)}\n\n"
-        except Exception as e:
-            logger.error(f"流式响应处理出错: {str(e)}")
-            # 如果R1失败，尝试使用Gemini
+            # 第一阶段：转发思考模型的推理过程
             try:
-                async with httpx.AsyncClient() as client:
-                    async with client.stream(
-                        "POST",
-                        f"{settings.PROXY_URL2}/v1/chat/completions",
-                        json={
-                            "model": settings.Model_output_MODEL,
-                            "messages": messages,
-                            "max_tokens": settings.Model_output_MAX_TOKENS,
-                            "temperature": settings.Model_output_TEMPERATURE,
-                            "stream": True
-                        },
-                        headers={
-                            "Authorization": f"Bearer {settings.Model_output_API_KEY}",
-                            "Content-Type": "application/json"
-                        }
-                    ) as response:
-                        async for line in response.aiter_lines():
-                            if line.startswith("data: "):
-                                yield line + "\n"
-            except Exception as gemini_error:
-                logger.error(f"Gemini也失败了: {str(gemini_error)}")
-                yield "data: {\"error\": \"All models failed\"}\n\n"
\ No newline at end of file
+                async for data in thinking:
+                    if not data.get("choices"):
+                        continue
+                    choice = data["choices"][0]
+                    reasoning, content = self._split_reasoning(choice.get("delta", {}), state)
+                    if reasoning:
+                        mark("thinking_first_token")
+                        reasoning_parts.append(reasoning)
+                        reasoning_length += len(reasoning)
+                        yield chunk({"reasoning_content": reasoning})
+                        speculative = settings.TWO_STAGE_SPECULATIVE_CHARS
+                        if output_task is None and speculative and reasoning_length >= speculative:
+                            # 投机启动：用已有的推理前缀提前调用输出模型，推理结束后再核对
+                            speculative_reasoning = "".join(reasoning_parts)
+                            output_task, output_queue = self._start_output_stage(
+                                messages, speculative_reasoning, request, span
+                            )
+                            mark("output_started")
+                    if content or choice.get("finish_reason"):
+                        break
+            except Exception as e:
+                upstream_error_logger.error(
+                    f"thinking:{type(e).__name__}", f"思考模型调用失败，直接使用输出模型: {str(e)}"
+                )
+            finally:
+                await thinking.aclose()
+            mark("thinking_done")
+            reasoning = "".join(reasoning_parts)
+
+            if output_task is not None and speculative_reasoning != reasoning:
+                # 投机请求只看到了推理前缀，回答没有依据完整推理，丢弃后重新调用
+                output_task.cancel()
+                await asyncio.gather(output_task, return_exceptions=True)
+                output_task = None
+                mark("speculation_discarded")
+
+            # 第二阶段：推理结束后立即开始输出模型的流式回答
+            if output_task is None:
+                output_task, output_queue = self._start_output_stage(messages, reasoning, request, span)
+                mark("output_started")
+
+            finish_reason = None
+            while True:
+                item = await output_queue.get()
+                if item is None:
+                    break
+                if isinstance(item, Exception):
+                    raise item
+                if not item.get("choices"):
+                    continue
+                choice = item["choices"][0]
+                content = choice.get("delta", {}).get("content")
+                if content:
+                    mark("output_first_token")
+                    yield chunk({"content": content})
+                finish_reason = choice.get("finish_reason") or finish_reason
+            mark("output_done")
+            yield chunk({}, finish_reason or "stop")
+            yield "data: [DONE]\n\n"
+        except Exception as e:
+            upstream_error_logger.error(f"output:{type(e).__name__}", f"输出模型流式调用失败: {str(e)}")
+            if span is not None:
+                span.set_error(e)
+            yield "data: {\"error\": \"All models failed\"}\n\n"
+        finally:
+            INFLIGHT_STREAMS.dec()
+            if output_task is not None and not output_task.done():
+                output_task.cancel()
+            logger.info(f"两阶段耗时(秒): {timings}")
+            if span is not None:
+                for stage, seconds in timings.items():
+                    span.set_attribute(stage, seconds)
+                span.end()
+
+    async def complete_response(
+        self,
+        messages: List[Dict[str, Any]],
+        request: Any
+    ) -> Dict[str, Any]:
+        """两阶段非流式响应，返回 chat.completion 对象；思考模型失败时与流式一样直接使用输出模型"""
+        span = tracer.start_span("complete_response")
+        started = time.perf_counter()
+        try:
+            reasoning = await self._collect_reasoning(messages, span)
+            completion = await self._complete(
+                "output",
+                settings.PROXY_URL2,
+                settings.Model_output_API_KEY,
+                self._output_payload(messages, reasoning, request),
+                span
+            )
+            choice = completion["choices"][0]
+            message = {"role": "assistant", "content": choice.get("message", {}).get("content") or ""}
+            if reasoning:
+                message["reasoning_content"] = reasoning
+            result = {
+                "id": f"chatcmpl-{uuid.uuid4().hex}",
+                "object": "chat.completion",
+                "created": int(time.time()),
+                "model": settings.HYBRID_MODEL_NAME,
+                "choices": [{
+                    "index": 0,
+                    "message": message,
+                    "finish_reason": choice.get("finish_reason") or "stop"
+                }]
+            }
+            if completion.get("usage"):
+                result["usage"] = completion["usage"]
+            return result
+        except Exception as e:
+            upstream_error_logger.error(f"output:{type(e).__name__}", f"输出模型非流式调用失败: {str(e)}")
+            if span is not None:
+                span.set_error(e)
+            raise
+        finally:
+            logger.info(f"两阶段非流式耗时(秒): {round(time.perf_counter() - started, 3)}")
+            if span is not None:
+                span.end()
+
+    async def _collect_reasoning(self, messages: List[Dict[str, Any]], span: Optional[Span] = None) -> str:
+        """读取思考模型的推理内容，出现正文即停止；思考模型失败时返回已收到的部分"""
+        parts: List[str] = []
+        state = {"in_think": False, "seen_content": False}
+        thinking = self._stream_chunks(
+            "thinking",
+            settings.PROXY_URL,
+            settings.DEEPSEEK_R1_API_KEY,
+            self._thinking_payload(messages),
+            span
+        )
+        try:
+            async for data in thinking:
+                if not data.get("choices"):
+                    continue
+                choice = data["choices"][0]
+                reasoning, content = self._split_reasoning(choice.get("delta", {}), state)
+                if reasoning:
+                    parts.append(reasoning)
+                if content or choice.get("finish_reason"):
+                    break
+        except Exception as e:
+            upstream_error_logger.error(
+                f"thinking:{type(e).__name__}", f"思考模型调用失败，直接使用输出模型: {str(e)}"
+            )
+        finally:
+            await thinking.aclose()
+        return "".join(parts)
@@ -0,0 +1,255 @@
+from typing import List, Dict, Any, Optional, AsyncGenerator, Mapping
+from pathlib import Path
+import asyncio
+import hashlib
+import json
+import time
+import uuid
+from loguru import logger
+from config.settings import settings
+from modules.state_backend import TTLCache, submit_write
+from modules.image_processor import ImageBuffer
+
+# 客户端通过该请求头主动开启缓存（temperature 不为 0 时）
+CACHE_HEADER = "X-ModelMix-Cache"
+# 回放缓存时每个合成 SSE 分片包含的字符数
+REPLAY_CHUNK_SIZE = 64
+# 磁盘层每写入这么多条后清理一次过期和超出数量上限的文件
+DISK_PRUNE_INTERVAL = 100
+
+def _image_digest(image: Dict[str, Any]) -> str:
+    image_url = image.get("image_url") or {}
+    digest = hashlib.sha256(image_url.get("url", "").encode("utf-8"))
+    digest.update(str(image_url.get("detail")).encode("utf-8"))
+    return digest.hexdigest()
+
+class ResponseCache:
+    def __init__(
+        self,
+        max_entries: int = settings.RESPONSE_CACHE_MAX_ENTRIES,
+        ttl: int = settings.RESPONSE_CACHE_TTL,
+        cache_dir: Optional[str] = settings.RESPONSE_CACHE_DIR,
+        disk_max_entries: int = settings.RESPONSE_CACHE_DISK_MAX_ENTRIES
+    ):
+        self.enabled = settings.RESPONSE_CACHE_ENABLED
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._memory = TTLCache(max_entries, ttl, "response")
+        self.hits = 0
+        self.misses = 0
+        self.cache_dir = Path(cache_dir) if cache_dir else None
+        self.disk_max_entries = disk_max_entries
+        self._disk_writes = 0
+        if self.cache_dir:
+            self.cache_dir.mkdir(parents=True, exist_ok=True)
+
+    @staticmethod
+    def make_key(
+        model: str,
+        messages: List[Dict[str, Any]],
+        temperature: Optional[float],
+        max_tokens: Optional[int]
+    ) -> str:
+        """根据模型、消息、温度和最大 token 数生成规范化哈希；
+        图片换成占位符和各自的摘要，base64 数据不会再被序列化一遍"""
+        text_messages, images = ImageBuffer.detach(messages)
+        canonical = json.dumps(
+            {
+                "model": model,
+                "messages": text_messages,
+                "images": {image_id: _image_digest(image) for image_id, image in images.images.items()},
+                "temperature": temperature,
+                "max_tokens": max_tokens
+            },
+            sort_keys=True,
+            ensure_ascii=False,
+            separators=(",", ":")
+        )
+        return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+    @staticmethod
+    def is_cacheable(temperature: Optional[float], headers: Mapping[str, str]) -> bool:
+        """temperature 为 0 或客户端显式要求时才允许缓存"""
+        if temperature == 0:
+            return True
+        return headers.get(CACHE_HEADER, "").strip().lower() in ("1", "true", "on")
+
+    @staticmethod
+    def is_bypassed(headers: Mapping[str, str]) -> bool:
+        """客户端发送 Cache-Control: no-cache 时跳过缓存读取，回答仍会写入缓存"""
+        return "no-cache" in headers.get("Cache-Control", "").lower()
+
+    @staticmethod
+    def is_no_store(headers: Mapping[str, str]) -> bool:
+        """客户端发送 Cache-Control: no-store 时既不读取也不写入缓存"""
+        return "no-store" in headers.get("Cache-Control", "").lower()
+
+    async def get(self, key: str) -> Optional[Dict[str, Any]]:
+        entry = await self._memory.get(key)
+        if entry is not None:
+            self.hits += 1
+            return entry
+
+        record = await asyncio.to_thread(self._read_disk, key) if self.cache_dir else None
+        if record is not None:
+            # 磁盘命中后提升到内存层
+            self._memory.set(key, record["entry"])
+            self.hits += 1
+            return record["entry"]
+        self.misses += 1
+        return None
+
+    def set(self, key: str, entry: Dict[str, Any]) -> None:
+        self._memory.set(key, entry)
+        if not self.cache_dir:
+            return
+        # 磁盘写入和清理都交给后台写入线程，按提交顺序执行
+        submit_write(self._write_disk, key, {"expires_at": time.time() + self.ttl, "entry": entry})
+        self._disk_writes += 1
+        if self._disk_writes % DISK_PRUNE_INTERVAL == 0:
+            submit_write(self._prune_disk)
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "entries": len(self._memory)
+        }
+
+    def _read_disk(self, key: str) -> Optional[Dict[str, Any]]:
+        if not self.cache_dir:
+            return None
+        path = self.cache_dir / f"{key}.json"
+        try:
+            record = json.loads(path.read_text(encoding="utf-8"))
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            logger.error(f"读取磁盘缓存失败 {path}: {str(e)}")
+            return None
+        if record.get("expires_at", 0) <= time.time():
+            path.unlink(missing_ok=True)
+            return None
+        return record
+
+    def _write_disk(self, key: str, record: Dict[str, Any]) -> None:
+        if not self.cache_dir:
+            return
+        path = self.cache_dir / f"{key}.json"
+        tmp_path = path.with_suffix(".tmp")
+        try:
+            tmp_path.write_text(json.dumps(record, ensure_ascii=False), encoding="utf-8")
+            tmp_path.replace(path)
+        except Exception as e:
+            logger.error(f"写入磁盘缓存失败 {path}: {str(e)}")
+
+    def _prune_disk(self) -> None:
+        """删除过期的缓存文件，剩余文件超过 disk_max_entries 时按写入时间删除最旧的"""
+        now = time.time()
+        files = []
+        for path in self.cache_dir.glob("*.json"):
+            try:
+                written_at = path.stat().st_mtime
+            except FileNotFoundError:
+                continue
+            if written_at + self.ttl <= now:
+                path.unlink(missing_ok=True)
+            else:
+                files.append((written_at, path))
+        files.sort()
+        for _, path in files[:max(0, len(files) - self.disk_max_entries)]:
+            path.unlink(missing_ok=True)
+
+    async def record_stream(
+        self,
+        key: str,
+        stream: AsyncGenerator[str, None]
+    ) -> AsyncGenerator[str, None]:
+        """透传上游流，并在完整结束后把拼接的回答写入缓存"""
+        parts: List[str] = []
+        finish_reason = None
+        model = None
+        completed = True
+        async for line in stream:
+            yield line
+            for raw in line.splitlines():
+                if not raw.startswith("data: "):
+                    continue
+                if raw.strip() == "data: [DONE]":
+                    continue
+                try:
+                    data = json.loads(raw[6:])
+                except ValueError:
+                    completed = False
+                    continue
+                if "error" in data or not data.get("choices"):
+                    completed = False
+                    continue
+                model = model or data.get("model")
+                choice = data["choices"][0]
+                content = choice.get("delta", {}).get("content")
+                if content:
+                    parts.append(content)
+                finish_reason = choice.get("finish_reason") or finish_reason
+
+        if completed and parts:
+            self.set(key, {
+                "content": "".join(parts),
+                "finish_reason": finish_reason or "stop",
+                "model": model
+            })
+
+    def record_completion(self, key: str, completion: Dict[str, Any]) -> None:
+        """把非流式调用得到的 chat.completion 写入缓存"""
+        choice = completion["choices"][0]
+        content = choice.get("message", {}).get("content")
+        if content:
+            self.set(key, {
+                "content": content,
+                "finish_reason": choice.get("finish_reason") or "stop",
+                "model": completion.get("model")
+            })
+
+    @staticmethod
+    async def replay_stream(entry: Dict[str, Any]) -> AsyncGenerator[str, None]:
+        """把缓存的完整回答回放为合成的 SSE 分片"""
+        completion_id = f"chatcmpl-{uuid.uuid4().hex}"
+        created = int(time.time())
+        content = entry["content"]
+
+        def chunk(delta: Dict[str, Any], finish_reason: Optional[str] = None) -> str:
+            data = {
+                "id": completion_id,
+                "object": "chat.completion.chunk",
+                "created": created,
+                "model": entry.get("model") or settings.HYBRID_MODEL_NAME,
+                "choices": [{
+                    "delta": delta,
+                    "index": 0,
+                    "finish_reason": finish_reason
+                }]
+            }
+            return f"data: {json.dumps(data)}\n\n"
+
+        yield chunk({"role": "assistant", "content": ""})
+        for start in range(0, len(content), REPLAY_CHUNK_SIZE):
+            yield chunk({"content": content[start:start + REPLAY_CHUNK_SIZE]})
+        yield chunk({}, entry.get("finish_reason", "stop"))
+        yield "data: [DONE]\n\n"
+
+    @staticmethod
+    def build_completion(entry: Dict[str, Any]) -> Dict[str, Any]:
+        """把缓存的回答构造成 OpenAI 格式的 chat.completion 对象"""
+        return {
+            "id": f"chatcmpl-{uuid.uuid4().hex}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": entry.get("model") or settings.HYBRID_MODEL_NAME,
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": entry["content"]},
+                "finish_reason": entry.get("finish_reason", "stop")
+            }]
+        }
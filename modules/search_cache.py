@@ -0,0 +1,96 @@
+from typing import List, Dict, Any, Optional
+import hashlib
+import re
+from config.settings import settings
+from modules.state_backend import TTLCache
+
+# 明显不需要联网搜索的寒暄/确认类短语
+GREETING_PATTERN = re.compile(
+    r'^(hi|hello|hey|thanks|thank you|ok|okay|bye|good (morning|afternoon|evening|night)|'
+    r'你好|您好|嗨|哈喽|谢谢|多谢|好的|好|嗯|再见|早上好|晚上好|晚安)[\s!！.。~～,，]*$',
+    re.IGNORECASE
+)
+# 表示提问或需要时效信息的线索，命中任意一个就交给模型判断
+SEARCH_HINT_PATTERN = re.compile(
+    r'[?？]|\b(what|who|when|where|which|why|how|tell me|find|look up|'
+    r'latest|news|today|current|price|weather|search)\b|'
+    r'什么|谁|哪|为什么|怎么|如何|多少|是否|吗|呢|介绍|告诉|最新|新闻|今天|现在|目前|价格|天气|搜索|查',
+    re.IGNORECASE
+)
+
+class CacheStats:
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        self.skipped = 0
+        self._miss_seconds = 0.0
+
+    def record_miss(self, elapsed: float) -> None:
+        self.misses += 1
+        self._miss_seconds += elapsed
+
+    def to_dict(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        avg_miss = self._miss_seconds / self.misses if self.misses else 0.0
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "skipped": self.skipped,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "avg_miss_seconds": round(avg_miss, 4),
+            # 每次命中按平均未命中耗时估算节省的首 token 时间
+            "ttft_saved_seconds": round(self.hits * avg_miss, 3)
+        }
+
+class SearchCache:
+    def __init__(self):
+        self.decisions = TTLCache(
+            settings.SEARCH_CACHE_MAX_ENTRIES, settings.SEARCH_DECISION_CACHE_TTL, "search_decision"
+        )
+        self.results = TTLCache(
+            settings.SEARCH_CACHE_MAX_ENTRIES, settings.SEARCH_RESULT_CACHE_TTL, "search_result"
+        )
+        self.decision_stats = CacheStats()
+        self.result_stats = CacheStats()
+
+    @staticmethod
+    def last_user_text(messages: List[Dict[str, Any]]) -> str:
+        for message in reversed(messages):
+            if message.get('role') != 'user':
+                continue
+            content = message.get('content')
+            if isinstance(content, str):
+                return content
+            if isinstance(content, list):
+                return '\n'.join(
+                    item.get('text', '') for item in content
+                    if item.get('type') == 'text'
+                )
+            return ''
+        return ''
+
+    @staticmethod
+    def decision_key(messages: List[Dict[str, Any]]) -> str:
+        text = SearchCache.last_user_text(messages).strip()
+        return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+    @staticmethod
+    def normalize_terms(search_terms: str) -> str:
+        terms = re.sub(r'[\s"\'“”‘’`]+', ' ', search_terms.lower())
+        return terms.strip(' .。,，;；')
+
+    @staticmethod
+    def prefilter(messages: List[Dict[str, Any]]) -> Optional[bool]:
+        """本地启发式判断：明显不需要搜索时返回 False，其余返回 None 交给模型"""
+        text = SearchCache.last_user_text(messages).strip()
+        if not text or GREETING_PATTERN.match(text):
+            return False
+        if not SEARCH_HINT_PATTERN.search(text):
+            return False
+        return None
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "search_decision": self.decision_stats.to_dict(),
+            "search_result": self.result_stats.to_dict()
+        }
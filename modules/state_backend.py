@@ -0,0 +1,247 @@
+from typing import Dict, Any, Optional, Callable
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from pathlib import Path
+import asyncio
+import json
+import sqlite3
+import threading
+import time
+from loguru import logger
+from config.settings import settings
+
+class StateBackend:
+    """缓存与运行时配置的存储接口，shared 表示数据在多个 worker 间共享"""
+    shared = False
+
+    def get(self, namespace: str, key: str) -> Optional[Any]:
+        raise NotImplementedError
+
+    def set(self, namespace: str, key: str, value: Any, ttl: Optional[float] = None) -> None:
+        raise NotImplementedError
+
+    def delete(self, namespace: str, key: str) -> None:
+        raise NotImplementedError
+
+    def items(self, namespace: str) -> Dict[str, Any]:
+        raise NotImplementedError
+
+class InProcessBackend(StateBackend):
+    """单进程内存存储，适用于单 worker 部署"""
+
+    def __init__(self):
+        self._data: Dict[str, Dict[str, tuple]] = {}
+        self._lock = threading.Lock()
+
+    def get(self, namespace: str, key: str) -> Optional[Any]:
+        with self._lock:
+            item = self._data.get(namespace, {}).get(key)
+            if item is None:
+                return None
+            expires_at, value = item
+            if expires_at is not None and expires_at <= time.time():
+                del self._data[namespace][key]
+                return None
+            return value
+
+    def set(self, namespace: str, key: str, value: Any, ttl: Optional[float] = None) -> None:
+        expires_at = time.time() + ttl if ttl else None
+        with self._lock:
+            self._data.setdefault(namespace, {})[key] = (expires_at, value)
+
+    def delete(self, namespace: str, key: str) -> None:
+        with self._lock:
+            self._data.get(namespace, {}).pop(key, None)
+
+    def items(self, namespace: str) -> Dict[str, Any]:
+        now = time.time()
+        with self._lock:
+            return {
+                key: value
+                for key, (expires_at, value) in self._data.get(namespace, {}).items()
+                if expires_at is None or expires_at > now
+            }
+
+class SQLiteBackend(StateBackend):
+    """基于 SQLite WAL 的共享存储，同一台机器上的多个 worker 可以共用"""
+    shared = True
+    # 每写入这么多次清理一次过期数据
+    PURGE_EVERY = 500
+
+    def __init__(self, path: str):
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._writes = 0
+        self._conn = sqlite3.connect(path, timeout=5.0, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS state ("
+            "namespace TEXT NOT NULL, key TEXT NOT NULL, value TEXT NOT NULL, expires_at REAL, "
+            "PRIMARY KEY (namespace, key))"
+        )
+
+    def get(self, namespace: str, key: str) -> Optional[Any]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value, expires_at FROM state WHERE namespace = ? AND key = ?",
+                (namespace, key)
+            ).fetchone()
+        if row is None:
+            return None
+        value, expires_at = row
+        if expires_at is not None and expires_at <= time.time():
+            self.delete(namespace, key)
+            return None
+        return json.loads(value)
+
+    def set(self, namespace: str, key: str, value: Any, ttl: Optional[float] = None) -> None:
+        expires_at = time.time() + ttl if ttl else None
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO state (namespace, key, value, expires_at) VALUES (?, ?, ?, ?)",
+                (namespace, key, json.dumps(value, ensure_ascii=False), expires_at)
+            )
+            self._writes += 1
+            if self._writes % self.PURGE_EVERY == 0:
+                self._conn.execute(
+                    "DELETE FROM state WHERE expires_at IS NOT NULL AND expires_at <= ?",
+                    (time.time(),)
+                )
+
+    def delete(self, namespace: str, key: str) -> None:
+        with self._lock:
+            self._conn.execute(
+                "DELETE FROM state WHERE namespace = ? AND key = ?",
+                (namespace, key)
+            )
+
+    def items(self, namespace: str) -> Dict[str, Any]:
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT key, value FROM state WHERE namespace = ? "
+                "AND (expires_at IS NULL OR expires_at > ?)",
+                (namespace, time.time())
+            ).fetchall()
+        return {key: json.loads(value) for key, value in rows}
+
+def create_state_backend() -> StateBackend:
+    if settings.STATE_BACKEND == 'sqlite':
+        logger.info(f"使用 SQLite 共享状态存储: {settings.STATE_DB_PATH}")
+        return SQLiteBackend(settings.STATE_DB_PATH)
+    if settings.STATE_BACKEND != 'memory':
+        raise ValueError(f'不支持的状态存储类型: {settings.STATE_BACKEND}')
+    return InProcessBackend()
+
+state_backend = create_state_backend()
+
+# 共享存储的写入在单独的线程中按顺序执行，请求处理不等待写入完成
+_writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="state-writer")
+
+def submit_write(fn: Callable[..., Any], *args: Any) -> None:
+    """在后台写入线程中按提交顺序执行 fn，不阻塞事件循环"""
+    _writer.submit(fn, *args).add_done_callback(_log_write_error)
+
+def write_behind(backend: StateBackend, namespace: str, key: str, value: Any, ttl: Optional[float] = None) -> None:
+    if not backend.shared:
+        backend.set(namespace, key, value, ttl)
+        return
+    submit_write(backend.set, namespace, key, value, ttl)
+
+def flush_writes() -> None:
+    """等待已提交的写入全部完成，供关闭服务时调用"""
+    _writer.submit(lambda: None).result()
+
+def _log_write_error(future: Future) -> None:
+    if future.exception() is not None:
+        logger.error(f"后台写入失败: {str(future.exception())}")
+
+class TTLCache:
+    """进程内 LRU 缓存；状态存储为共享类型时作为二级缓存，在线程中读取、后台写入，不阻塞事件循环"""
+
+    def __init__(self, max_entries: int, ttl: float, namespace: str, backend: StateBackend = state_backend):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.namespace = namespace
+        self.backend = backend if backend.shared else None
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+
+    async def get(self, key: str) -> Any:
+        item = self._entries.get(key)
+        if item is not None:
+            expires_at, value = item
+            if expires_at > time.monotonic():
+                self._entries.move_to_end(key)
+                return value
+            del self._entries[key]
+
+        if self.backend is None:
+            return None
+        value = await asyncio.to_thread(self.backend.get, self.namespace, key)
+        if value is not None:
+            self._remember(key, value)
+        return value
+
+    def set(self, key: str, value: Any) -> None:
+        self._remember(key, value)
+        if self.backend is not None:
+            write_behind(self.backend, self.namespace, key, value, self.ttl)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def _remember(self, key: str, value: Any) -> None:
+        self._entries[key] = (time.monotonic() + self.ttl, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+class RuntimeConfig:
+    """通过状态存储在各 worker 之间同步 /config/model 的修改
+
+    每条修改记录写入时间和它覆盖的原值（来自 .env 或默认值）：同步时跳过比本进程最近一次修改更旧的记录，
+    原值与本进程启动时的值不同（.env 已更新）的记录也会被忽略，以 .env 为准"""
+    NAMESPACE = "config"
+
+    def __init__(self, target: Any = settings, backend: StateBackend = state_backend):
+        self.target = target
+        self.backend = backend
+        self._last_sync = 0.0
+        # 每个配置项在本进程中的原值和当前值的修改时间
+        self._base: Dict[str, Any] = {}
+        self._updated_at: Dict[str, float] = {}
+
+    def _remember_base(self, name: str) -> Any:
+        if name not in self._base:
+            self._base[name] = getattr(self.target, name, None)
+        return self._base[name]
+
+    def update(self, values: Dict[str, Any]) -> None:
+        updated_at = time.time()
+        for name, value in values.items():
+            base = self._remember_base(name)
+            setattr(self.target, name, value)
+            self._updated_at[name] = updated_at
+            write_behind(self.backend, self.NAMESPACE, name, {"value": value, "base": base, "updated_at": updated_at})
+
+    async def refresh(self, force: bool = False) -> None:
+        """按 CONFIG_SYNC_INTERVAL 节流，把共享存储中的配置应用到本进程"""
+        if not self.backend.shared:
+            return
+        now = time.monotonic()
+        if not force and now - self._last_sync < settings.CONFIG_SYNC_INTERVAL:
+            return
+        # 先更新时间戳，读取期间到达的其他请求不再重复读取
+        self._last_sync = now
+        records = await asyncio.to_thread(self.backend.items, self.NAMESPACE)
+        for name, record in records.items():
+            if not isinstance(record, dict) or "updated_at" not in record:
+                continue
+            # 本进程的修改还在后台写入队列中时，存储里的旧值不能覆盖它
+            if record["updated_at"] < self._updated_at.get(name, 0.0):
+                continue
+            if record.get("base") != self._remember_base(name):
+                continue
+            self._updated_at[name] = record["updated_at"]
+            if getattr(self.target, name, None) != record["value"]:
+                setattr(self.target, name, record["value"])
@@ -0,0 +1,186 @@
+from typing import Dict, Any, Optional, List
+from contextlib import contextmanager
+from contextvars import ContextVar
+from pathlib import Path
+import asyncio
+import json
+import random
+import secrets
+import time
+import httpx
+from loguru import logger
+from config.settings import settings
+
+SERVICE_NAME = "modelmix"
+# OTLP 状态码：1 为成功，2 为错误
+STATUS_OK = 1
+STATUS_ERROR = 2
+
+class Span:
+    def __init__(self, name: str, trace_id: str, parent_id: Optional[str], sampled: bool, spans: List["Span"]):
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = secrets.token_hex(8)
+        self.parent_id = parent_id
+        self.sampled = sampled
+        self.attributes: Dict[str, Any] = {}
+        self.status = STATUS_OK
+        self.status_message = ""
+        self.start_ns = time.time_ns()
+        self.end_ns: Optional[int] = None
+        # 同一条 trace 的所有 span 共用一个列表，根 span 结束时统一导出
+        self._spans = spans
+
+    def set_attribute(self, key: str, value: Any) -> None:
+        if self.sampled:
+            self.attributes[key] = value
+
+    def set_error(self, error: BaseException) -> None:
+        self.status = STATUS_ERROR
+        self.status_message = str(error)
+
+    def child(self, name: str, **attributes: Any) -> "Span":
+        span = Span(name, self.trace_id, self.span_id, self.sampled, self._spans)
+        span.attributes.update(attributes if self.sampled else {})
+        return span
+
+    def end(self) -> None:
+        if self.end_ns is not None:
+            return
+        self.end_ns = time.time_ns()
+        if self.sampled:
+            self._spans.append(self)
+
+    def traceparent(self) -> str:
+        return f"00-{self.trace_id}-{self.span_id}-{'01' if self.sampled else '00'}"
+
+    def to_otlp(self) -> Dict[str, Any]:
+        data = {
+            "traceId": self.trace_id,
+            "spanId": self.span_id,
+            "name": self.name,
+            "kind": 1,
+            "startTimeUnixNano": str(self.start_ns),
+            "endTimeUnixNano": str(self.end_ns),
+            "attributes": [
+                {"key": key, "value": _otlp_value(value)}
+                for key, value in self.attributes.items()
+            ],
+            "status": {"code": self.status, "message": self.status_message}
+        }
+        if self.parent_id:
+            data["parentSpanId"] = self.parent_id
+        return data
+
+def _otlp_value(value: Any) -> Dict[str, Any]:
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+class Tracer:
+    """轻量级请求追踪：按采样率记录 span，并以 OTLP JSON 写入文件或发送到采集器"""
+
+    def __init__(self):
+        self.sample_rate = settings.TRACE_SAMPLE_RATE
+        self.export_file = Path(settings.TRACE_EXPORT_FILE) if settings.TRACE_EXPORT_FILE else None
+        self.collector_url = settings.TRACE_COLLECTOR_URL
+        self._current: ContextVar[Optional[Span]] = ContextVar("current_span", default=None)
+        self._client: Optional[httpx.AsyncClient] = None
+        self._exports = set()
+
+    def start_trace(self, name: str, traceparent: Optional[str] = None) -> Span:
+        """创建根 span 并设为当前 span；沿用客户端传入的 traceparent 中的 trace ID，
+        是否采样只由本地采样率决定，客户端无法强制记录"""
+        trace_id, parent_id = None, None
+        if traceparent:
+            parts = traceparent.split("-")
+            if len(parts) == 4 and len(parts[1]) == 32 and len(parts[2]) == 16:
+                trace_id, parent_id = parts[1], parts[2]
+        sampled = self.sample_rate > 0 and random.random() < self.sample_rate
+        root = Span(name, trace_id or secrets.token_hex(16), parent_id, sampled, [])
+        self._current.set(root)
+        return root
+
+    def current(self) -> Optional[Span]:
+        return self._current.get()
+
+    def start_span(self, name: str, **attributes: Any) -> Optional[Span]:
+        """在当前 span 下创建子 span，但不切换当前 span，适合在异步生成器中使用"""
+        parent = self._current.get()
+        return parent.child(name, **attributes) if parent is not None else None
+
+    @contextmanager
+    def span(self, name: str, **attributes: Any):
+        span = self.start_span(name, **attributes)
+        if span is None:
+            yield None
+            return
+        token = self._current.set(span)
+        try:
+            yield span
+        except BaseException as e:
+            span.set_error(e)
+            raise
+        finally:
+            self._current.reset(token)
+            span.end()
+
+    @staticmethod
+    def headers(span: Optional[Span]) -> Dict[str, str]:
+        """转发给上游的追踪请求头"""
+        return {"traceparent": span.traceparent()} if span is not None else {}
+
+    def end_trace(self, root: Span, error: Optional[BaseException] = None) -> None:
+        if error is not None:
+            root.set_error(error)
+        root.end()
+        if not root.sampled or not root._spans:
+            return
+        payload = {
+            "resourceSpans": [{
+                "resource": {"attributes": [
+                    {"key": "service.name", "value": {"stringValue": SERVICE_NAME}}
+                ]},
+                "scopeSpans": [{
+                    "scope": {"name": SERVICE_NAME},
+                    "spans": [span.to_otlp() for span in root._spans]
+                }]
+            }]
+        }
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            self._write_file(payload)
+            return
+        # 导出放到线程池/后台任务，不占用请求路径
+        if self.export_file:
+            loop.run_in_executor(None, self._write_file, payload)
+        if self.collector_url:
+            task = loop.create_task(self._post_collector(payload))
+            self._exports.add(task)
+            task.add_done_callback(self._exports.discard)
+
+    def _write_file(self, payload: Dict[str, Any]) -> None:
+        if not self.export_file:
+            return
+        try:
+            self.export_file.parent.mkdir(parents=True, exist_ok=True)
+            with self.export_file.open("a", encoding="utf-8") as f:
+                f.write(json.dumps(payload, ensure_ascii=False) + "\n")
+        except Exception as e:
+            logger.error(f"写入追踪文件失败: {str(e)}")
+
+    async def _post_collector(self, payload: Dict[str, Any]) -> None:
+        if self._client is None:
+            self._client = httpx.AsyncClient(timeout=5.0)
+        try:
+            response = await self._client.post(f"{self.collector_url}/v1/traces", json=payload)
+            response.raise_for_status()
+        except Exception as e:
+            logger.error(f"发送追踪数据失败: {str(e)}")
+
+tracer = Tracer()
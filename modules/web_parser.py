@@ -1,57 +1,142 @@
-from typing import List, Dict, Any, Set
+from typing import List, Dict, Any, Optional, Set
 import httpx
-from bs4 import BeautifulSoup
 import asyncio
 from loguru import logger
-from urllib.parse import urlparse
+from urllib.parse import urlparse, urlunparse
 import re
+import time
 from config.settings import settings
+from modules.metrics import STAGE_SECONDS, UPSTREAM_REQUESTS
+from modules.tracing import tracer
+from utils.logger import upstream_error_logger
+from modules.state_backend import TTLCache
+
+URL_BLOCK_END = "[/URL内容]"
+# 已展开的 URL 内容块整体匹配并原样保留，块外的 URL 才会被展开
+URL_PATTERN = re.compile(
+    r'(?P<block>\[URL内容: (?P<marked>[^\]\s]+)\]\n.*?\n' + re.escape(URL_BLOCK_END) + r')'
+    r'|(?P<url>https?://[^\s)\]]+)',
+    re.DOTALL
+)
+# URL 末尾常见的标点，不属于链接本身
+TRAILING_PUNCTUATION = '.,;:!?\'"。，；：！？、）】」』>'
 
 class WebParser:
     def __init__(self):
         self.client = httpx.AsyncClient(timeout=settings.REQUEST_TIMEOUT)
-        self.url_cache = {}
+        self.url_cache = TTLCache(settings.URL_CACHE_MAX_ENTRIES, settings.URL_CACHE_TTL, "url")
+
+    @staticmethod
+    def prewarm() -> None:
+        """预先导入 BeautifulSoup（首次解析网页时才会导入），供启动时在后台线程调用"""
+        import bs4  # noqa: F401
 
     async def preprocess_messages(self, messages: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
-        processed_messages = messages.copy()
-        all_urls: Set[str] = set()
-        
-        for message in messages:
-            text_content = ''
-            if isinstance(message['content'], str):
-                text_content = message['content']
-            elif isinstance(message['content'], list):
-                text_content = '\n'.join(
-                    item['text'] for item in message['content']
-                    if item.get('type') == 'text'
-                )
-                
-            if text_content:
-                urls = re.findall(r'https?://[^\s)]+', text_content)
-                all_urls.update(url.strip() for url in urls if self._is_valid_url(url))
-                
-        urls_to_process = [url for url in all_urls if url not in self.url_cache]
+        with tracer.span("preprocess_messages"):
+            return await self._preprocess_messages(messages)
+
+    async def _preprocess_messages(self, messages: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        # 第一遍：收集待展开的 URL，已带展开标记的 URL 不再获取
+        expanded: Set[str] = set()
+        found: Dict[str, str] = {}
+        normalized_urls: Dict[str, Optional[str]] = {}
+        for text in self._iter_texts(messages):
+            for match in URL_PATTERN.finditer(text):
+                if match.group('block'):
+                    normalized = self._normalize_url(match.group('marked'))
+                    if normalized:
+                        expanded.add(normalized)
+                    continue
+                url = match.group('url').rstrip(TRAILING_PUNCTUATION)
+                if url not in normalized_urls:
+                    normalized_urls[url] = self._normalize_url(url)
+                normalized = normalized_urls[url]
+                if normalized and normalized not in found:
+                    found[normalized] = url
+
+        url_contents: Dict[str, str] = {}
+        urls_to_process = []
+        for normalized, url in found.items():
+            if normalized in expanded:
+                continue
+            content = await self.url_cache.get(normalized)
+            if content is None:
+                urls_to_process.append((normalized, url))
+            else:
+                url_contents[normalized] = content
         if urls_to_process:
-            contents = await asyncio.gather(*[self._parse_url(url) for url in urls_to_process])
-            for url, content in zip(urls_to_process, contents):
+            contents = await asyncio.gather(*[self._parse_url(url) for _, url in urls_to_process])
+            for (normalized, _), content in zip(urls_to_process, contents):
                 if content:
-                    self.url_cache[url] = content
-                    
-        for message in processed_messages:
-            if isinstance(message['content'], str):
-                for url in all_urls:
-                    if url in message['content'] and url in self.url_cache:
-                        message['content'] = message['content'].replace(
-                            url, f"\n\n[URL内容: {url}]\n{self.url_cache[url]}\n"
-                        )
-                        
-        return processed_messages
+                    self.url_cache.set(normalized, content)
+                    url_contents[normalized] = content
+
+        if not url_contents:
+            return list(messages)
+
+        # 第二遍：每条消息一次 sub 生成新内容，同一 URL 只在首次出现处展开
+        inlined = set(expanded)
+
+        def replace(match) -> str:
+            if match.group('block'):
+                return match.group(0)
+            raw = match.group('url')
+            url = raw.rstrip(TRAILING_PUNCTUATION)
+            normalized = normalized_urls.get(url)
+            content = url_contents.get(normalized)
+            if not content or normalized in inlined:
+                return raw
+            inlined.add(normalized)
+            return f"\n\n[URL内容: {url}]\n{content}\n{URL_BLOCK_END}\n{raw[len(url):]}"
+
+        return [self._rewrite_message(message, replace) for message in messages]
+
+    @staticmethod
+    def _iter_texts(messages: List[Dict[str, Any]]):
+        for message in messages:
+            content = message.get('content')
+            if isinstance(content, str):
+                yield content
+            elif isinstance(content, list):
+                for item in content:
+                    if item.get('type') == 'text' and item.get('text'):
+                        yield item['text']
+
+    @staticmethod
+    def _rewrite_message(message: Dict[str, Any], replace) -> Dict[str, Any]:
+        """返回替换后的新消息，不修改调用方传入的消息"""
+        content = message.get('content')
+        if isinstance(content, str):
+            return {**message, 'content': URL_PATTERN.sub(replace, content)}
+        if isinstance(content, list):
+            return {**message, 'content': [
+                {**item, 'text': URL_PATTERN.sub(replace, item['text'])}
+                if item.get('type') == 'text' and item.get('text') else item
+                for item in content
+            ]}
+        return message
+
+    @classmethod
+    def _normalize_url(cls, url: str) -> Optional[str]:
+        """统一 scheme 与域名大小写并去掉锚点，用作去重和缓存的键"""
+        if not cls._is_valid_url(url):
+            return None
+        parsed = urlparse(url.strip())
+        return urlunparse(parsed._replace(
+            scheme=parsed.scheme.lower(),
+            netloc=parsed.netloc.lower(),
+            fragment=''
+        ))
         
     async def _parse_url(self, url: str) -> Optional[str]:
+        started = time.perf_counter()
+        outcome = "error"
+        span = tracer.start_span("url_fetch", url=url)
         try:
             response = await self.client.get(url)
             response.raise_for_status()
             
+            from bs4 import BeautifulSoup
             soup = BeautifulSoup(response.text, 'html.parser')
             
             # 移除不需要的元素
@@ -93,11 +178,23 @@ class WebParser:
                         paragraphs.append(text)
                 main_content = '\n\n'.join(paragraphs)
                 
+            outcome = "ok"
             return f"标题：{title}\n\n正文：\n{main_content}"
             
+        except asyncio.CancelledError:
+            # 客户端断开或预处理超时，请求被取消
+            outcome = "cancelled"
+            raise
         except Exception as e:
-            logger.error(f"解析URL失败 {url}: {str(e)}")
+            upstream_error_logger.error(f"url_fetch:{type(e).__name__}", f"解析URL失败 {url}: {str(e)}")
+            if span is not None:
+                span.set_error(e)
             return None
+        finally:
+            if span is not None:
+                span.end()
+            STAGE_SECONDS.observe(time.perf_counter() - started, stage="url_fetch", upstream="web")
+            UPSTREAM_REQUESTS.inc(model="", upstream="web", outcome=outcome)
             
     @staticmethod
     def _is_valid_url(url: str) -> bool:
@@ -0,0 +1,67 @@
+"""测试共用的夹具：应用内的上游 HTTP 客户端全部指向 benchmarks/mock_upstream.py，不发出真实网络请求"""
+from pathlib import Path
+import json
+import sys
+
+import httpx
+import pytest
+from fastapi.testclient import TestClient
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+import main  # noqa: E402
+from benchmarks import mock_upstream  # noqa: E402
+from config.settings import settings  # noqa: E402
+from modules.search_cache import SearchCache  # noqa: E402
+
+MOCK_URL = "http://mock-upstream"
+API_KEY = "test-key"
+
+class RecordingTransport(httpx.ASGITransport):
+    """把请求交给 mock 上游，同时记录 (路径, 请求体)"""
+
+    def __init__(self, app, calls):
+        super().__init__(app=app)
+        self.calls = calls
+
+    async def handle_async_request(self, request):
+        body = json.loads(request.content) if request.content else None
+        self.calls.append((request.url.path, body))
+        return await super().handle_async_request(request)
+
+@pytest.fixture
+def upstream_calls():
+    return []
+
+@pytest.fixture
+def upstream(monkeypatch, upstream_calls):
+    """返回 mock 上游的 CONFIG，测试可以修改回复内容、token 数等；上游收到的请求记录在 upstream_calls"""
+    monkeypatch.setattr(mock_upstream, "CONFIG", {
+        **mock_upstream.CONFIG,
+        "delay": 0.0,
+        "token_rate": 0.0,
+        "tokens": 3,
+        "reasoning_tokens": 2,
+        "reasoning_model": "mock-r1"
+    })
+    for name in ("PROXY_URL", "PROXY_URL2", "PROXY_URL3", "PROXY_URL4"):
+        monkeypatch.setattr(settings, name, MOCK_URL, raising=False)
+    monkeypatch.setattr(settings, "OPENAI_BASE_URL", f"{MOCK_URL}/v1", raising=False)
+    monkeypatch.setattr(settings, "DEEPSEEK_R1_MODEL", "mock-r1")
+    monkeypatch.setattr(settings, "Model_output_MODEL", "mock-output")
+    monkeypatch.setattr(settings, "OUTPUT_API_KEY", API_KEY)
+
+    transport = RecordingTransport(mock_upstream.app, upstream_calls)
+    for component in (main.model_handler, main.web_parser, main.image_processor):
+        monkeypatch.setattr(component, "client", httpx.AsyncClient(transport=transport))
+    monkeypatch.setattr(main.model_handler, "search_cache", SearchCache())
+    return mock_upstream.CONFIG
+
+@pytest.fixture
+def client(upstream, monkeypatch, tmp_path):
+    # 批处理任务写到临时目录；进入上下文后所有请求共用一个事件循环，后台任务可以跑完
+    monkeypatch.setattr(main.batch_runner, "batch_dir", tmp_path / "batches")
+    (tmp_path / "batches").mkdir()
+    with TestClient(main.app, headers={"Authorization": f"Bearer {API_KEY}"}) as test_client:
+        yield test_client
@@ -0,0 +1,114 @@
+import asyncio
+import json
+
+import main
+from config.settings import settings
+from modules.batch_runner import BatchRunner
+
+def completion(text):
+    return {"object": "chat.completion", "choices": [{"index": 0, "message": {"role": "assistant", "content": text}}]}
+
+async def wait_for(runner, job_id):
+    while (await runner.get(job_id))["status"] in ("queued", "running"):
+        await asyncio.sleep(0.01)
+    return await runner.get(job_id)
+
+def lines(*custom_ids):
+    return [
+        json.dumps({"custom_id": custom_id, "body": {"model": "m", "messages": [{"role": "user", "content": custom_id}]}})
+        for custom_id in custom_ids
+    ]
+
+def test_concurrency_is_shared_by_all_jobs(tmp_path):
+    inflight = peak = 0
+
+    async def process(body):
+        nonlocal inflight, peak
+        inflight += 1
+        peak = max(peak, inflight)
+        await asyncio.sleep(0.01)
+        inflight -= 1
+        return completion("ok")
+
+    async def run():
+        runner = BatchRunner(process, lambda body: [], batch_dir=str(tmp_path), concurrency=2)
+        jobs = [await runner.create(lines(*[f"{job}-{index}" for index in range(6)])) for job in range(3)]
+        return [await wait_for(runner, job["id"]) for job in jobs]
+
+    for job in asyncio.run(run()):
+        assert job["request_counts"]["completed"] == 6
+    assert peak == 2
+
+def resume_after_failure(tmp_path, retry_failed):
+    """第一次执行时 b 失败；再用新的 runner 模拟重启后恢复任务，返回恢复后的任务、输出记录和重新执行的请求"""
+    called = []
+
+    async def flaky(body):
+        if body["messages"][0]["content"] == "b":
+            raise ValueError("boom")
+        return completion("ok")
+
+    async def process(body):
+        called.append(body["messages"][0]["content"])
+        return completion("ok")
+
+    async def run():
+        first = BatchRunner(flaky, lambda body: [], batch_dir=str(tmp_path))
+        job = await first.create(lines("a", "b"))
+        job = await wait_for(first, job["id"])
+        assert job["request_counts"] == {"total": 2, "completed": 1, "failed": 1}
+
+        # 改回 running 状态，新的 runner 启动时会恢复该任务
+        job["status"] = "running"
+        first._save(job)
+        second = BatchRunner(process, lambda body: [], batch_dir=str(tmp_path), retry_failed=retry_failed)
+        await second.resume()
+        job = await wait_for(second, job["id"])
+        records = [json.loads(line) for line in second.output_path(job["id"]).read_text().splitlines()]
+        return job, records
+
+    job, records = asyncio.run(run())
+    return job, records, called
+
+def test_resume_retries_failed_lines(tmp_path):
+    job, records, called = resume_after_failure(tmp_path, retry_failed=True)
+    assert called == ["b"]
+    assert sorted(record["custom_id"] for record in records) == ["a", "b"]
+    assert all(record["error"] is None for record in records)
+    assert job["request_counts"] == {"total": 2, "completed": 2, "failed": 0}
+
+def test_resume_keeps_failed_lines_when_retry_disabled(tmp_path):
+    job, records, called = resume_after_failure(tmp_path, retry_failed=False)
+    assert called == []
+    assert [record["custom_id"] for record in records if record["error"]] == ["b"]
+    assert job["request_counts"] == {"total": 2, "completed": 1, "failed": 1}
+
+def test_cancel_is_not_overwritten_by_the_running_task(tmp_path):
+    started = asyncio.Event()
+
+    async def process(body):
+        started.set()
+        await asyncio.sleep(10)
+
+    async def run():
+        runner = BatchRunner(process, lambda body: [], batch_dir=str(tmp_path))
+        job = await runner.create(lines("a", "b"))
+        await started.wait()
+        cancelled = await runner.cancel(job["id"])
+        return cancelled, await runner.get(job["id"])
+
+    cancelled, stored = asyncio.run(run())
+    assert cancelled["status"] == stored["status"] == "cancelled"
+    assert stored["completed_at"] is not None
+
+def test_hybrid_lines_limit_search_and_image_upstreams(monkeypatch):
+    for index, name in enumerate(("PROXY_URL", "PROXY_URL2", "PROXY_URL3", "PROXY_URL4")):
+        monkeypatch.setattr(settings, name, f"http://upstream-{index}")
+
+    text = {"model": settings.HYBRID_MODEL_NAME, "messages": [{"role": "user", "content": "你好"}]}
+    image = {"model": settings.HYBRID_MODEL_NAME, "messages": [{"role": "user", "content": [
+        {"type": "text", "text": "这是什么"},
+        {"type": "image_url", "image_url": {"url": "data:image/png;base64,AAAA"}}
+    ]}]}
+    assert main.batch_upstreams(text) == ["http://upstream-0", "http://upstream-1", "http://upstream-3"]
+    assert main.batch_upstreams(image)[-1] == "http://upstream-2"
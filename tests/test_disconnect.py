@@ -0,0 +1,71 @@
+import asyncio
+import json
+
+import main
+from modules.metrics import CANCELLED_REQUESTS, UPSTREAM_REQUESTS
+
+def cancelled_upstream_calls():
+    return sum(value for key, value in UPSTREAM_REQUESTS._values.items() if key[-1] == "cancelled")
+
+def test_disconnect_mid_stream_closes_upstream(upstream, monkeypatch):
+    # ASGITransport 会缓冲整个 mock 响应，这里换成持续慢速输出的上游流；客户端收到第一个数据块后断开
+    closed = []
+
+    async def iter_sse(*args, **kwargs):
+        try:
+            while True:
+                yield {"object": "chat.completion.chunk", "choices": [{"index": 0, "delta": {"content": "token "}}]}
+                await asyncio.sleep(0.05)
+        finally:
+            closed.append(True)
+    monkeypatch.setattr(main.model_handler, "_iter_sse", iter_sse)
+
+    body = json.dumps({
+        "model": "openai",
+        "stream": True,
+        "messages": [{"role": "user", "content": "你好"}]
+    }).encode()
+    scope = {
+        "type": "http",
+        "asgi": {"version": "3.0"},
+        "http_version": "1.1",
+        "method": "POST",
+        "scheme": "http",
+        "path": "/v1/chat/completions",
+        "raw_path": b"/v1/chat/completions",
+        "query_string": b"",
+        "root_path": "",
+        "headers": [(b"content-type", b"application/json"), (b"authorization", b"Bearer test-key")],
+        "client": ("testclient", 50000),
+        "server": ("testserver", 80)
+    }
+    chunks = []
+
+    async def run():
+        first_chunk = asyncio.Event()
+        requested = False
+
+        async def receive():
+            nonlocal requested
+            if not requested:
+                requested = True
+                return {"type": "http.request", "body": body, "more_body": False}
+            await first_chunk.wait()
+            return {"type": "http.disconnect"}
+
+        async def send(message):
+            if message["type"] == "http.response.body" and message.get("body"):
+                chunks.append(message["body"])
+                first_chunk.set()
+
+        await asyncio.wait_for(main.app(scope, receive, send), timeout=5)
+
+    stream_cancelled = CANCELLED_REQUESTS._values.get(("stream",), 0)
+    upstream_cancelled = cancelled_upstream_calls()
+    asyncio.run(run())
+
+    assert chunks
+    assert closed
+    assert b"[DONE]" not in b"".join(chunks)
+    assert CANCELLED_REQUESTS._values.get(("stream",), 0) == stream_cancelled + 1
+    assert cancelled_upstream_calls() == upstream_cancelled + 1
@@ -0,0 +1,41 @@
+import asyncio
+
+import main
+from modules.image_processor import ImageBuffer
+
+def collect_progress(messages):
+    async def run():
+        return [
+            payload async for event, payload in main.enrich_messages(messages, ImageBuffer())
+            if event == "progress"
+        ]
+    return asyncio.run(run())
+
+def test_no_url_progress_without_links(upstream):
+    progress = collect_progress([{"role": "user", "content": "你好"}])
+    assert main.ENRICHMENT_PROGRESS["urls"] not in progress
+
+def test_url_progress_after_expanding_a_link(upstream, monkeypatch):
+    async def parse_url(url):
+        return "页面内容"
+    monkeypatch.setattr(main.web_parser, "_parse_url", parse_url)
+
+    progress = collect_progress([{"role": "user", "content": "看看 https://example.com/a"}])
+    assert main.ENRICHMENT_PROGRESS["urls"] in progress
+
+def enriched(messages, deadline=None):
+    async def run():
+        async for event, payload in main.enrich_messages(messages, ImageBuffer(), deadline):
+            if event == "done":
+                return payload
+    return asyncio.run(run())
+
+def test_slow_search_is_awaited_without_deadline(upstream, monkeypatch):
+    async def slow_search(messages):
+        await asyncio.sleep(0.2)
+        return "搜索结果"
+    monkeypatch.setattr(main, "perform_search_if_needed", slow_search)
+    messages = [{"role": "user", "content": "今天有什么新闻？"}]
+
+    assert "搜索结果" in str(enriched(messages))
+    assert "搜索结果" not in str(enriched(messages, deadline=0.05))
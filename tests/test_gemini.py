@@ -0,0 +1,22 @@
+import json
+
+def chat(client, stream):
+    return client.post("/v1/chat/completions", json={
+        "model": "gemini",
+        "stream": stream,
+        "messages": [{"role": "user", "content": "你好"}]
+    })
+
+def test_gemini_calls_the_output_model(client, upstream_calls):
+    response = chat(client, stream=False)
+    assert response.status_code == 200
+    assert response.json()["choices"][0]["message"]["content"] == "no"
+    assert [body["model"] for _, body in upstream_calls] == ["mock-output"]
+
+def test_gemini_stream(client, upstream_calls):
+    response = chat(client, stream=True)
+    assert response.status_code == 200
+    lines = [line for line in response.text.splitlines() if line.startswith("data: ")]
+    assert lines[-1] == "data: [DONE]"
+    assert json.loads(lines[0][6:])["choices"][0]["delta"]["content"] == "token "
+    assert [body["model"] for _, body in upstream_calls] == ["mock-output"]
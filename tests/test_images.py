@@ -0,0 +1,20 @@
+IMAGE = {"type": "image_url", "image_url": {"url": "data:image/png;base64,iVBORw0KGgo="}}
+
+def test_only_the_image_model_receives_image_data(client, upstream, upstream_calls):
+    upstream["reply"] = "一只猫"
+    response = client.post("/v1/chat/completions", json={
+        "model": "GeminiMIXR1",
+        "stream": False,
+        "messages": [{"role": "user", "content": [{"type": "text", "text": "这张图里有什么？"}, IMAGE]}]
+    })
+    assert response.status_code == 200
+
+    image_calls = [body for _, body in upstream_calls if IMAGE["image_url"]["url"] in str(body)]
+    assert len(image_calls) == 1
+    assert image_calls[0]["messages"][-1]["content"] == [IMAGE]
+
+    # 思考模型收到占位符和带图片 ID 的描述，而不是图片数据
+    thinking = next(body for _, body in upstream_calls if body["model"] == "mock-r1")
+    text = str(thinking["messages"])
+    assert "[图片 img-1]" in text
+    assert "[图片 img-1] 一只猫" in text
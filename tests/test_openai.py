@@ -0,0 +1,42 @@
+import json
+import time
+
+def chat(client, stream):
+    return client.post("/v1/chat/completions", json={
+        "model": "openai",
+        "stream": stream,
+        "messages": [{"role": "user", "content": "你好"}]
+    })
+
+def test_openai_non_stream(client, upstream_calls):
+    response = chat(client, stream=False)
+    assert response.status_code == 200
+    body = response.json()
+    assert body["object"] == "chat.completion"
+    assert body["choices"][0]["message"]["content"] == "no"
+
+    path, payload = upstream_calls[-1]
+    assert path == "/v1/chat/completions"
+    assert payload["stream"] is False
+    assert payload["messages"][0]["role"] == "system"
+
+def test_openai_stream(client):
+    response = chat(client, stream=True)
+    assert response.status_code == 200
+    lines = [line for line in response.text.splitlines() if line.startswith("data: ")]
+    assert lines[-1] == "data: [DONE]"
+    chunks = [json.loads(line[6:]) for line in lines[:-1]]
+    assert "".join(chunk["choices"][0]["delta"].get("content") or "" for chunk in chunks) == "token " * 3
+
+def test_openai_batch_line(client):
+    job = client.post("/v1/batches", json={"requests": [{"custom_id": "a", "body": {
+        "model": "openai", "messages": [{"role": "user", "content": "你好"}]
+    }}]}).json()
+    deadline = time.monotonic() + 5
+    while client.get(f"/v1/batches/{job['id']}").json()["status"] != "completed":
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+    output = client.get(f"/v1/batches/{job['id']}/output")
+    record = json.loads(output.text.splitlines()[0])
+    assert record["error"] is None
+    assert record["response"]["body"]["choices"][0]["message"]["content"] == "no"
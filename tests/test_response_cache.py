@@ -0,0 +1,69 @@
+import asyncio
+import json
+import os
+
+import main
+from modules.response_cache import ResponseCache
+from modules.state_backend import flush_writes
+
+def completion(model, content="你好"):
+    return {"model": model, "choices": [{"index": 0, "message": {"role": "assistant", "content": content}}]}
+
+def test_disk_entry_keeps_the_model(tmp_path):
+    ResponseCache(cache_dir=str(tmp_path)).record_completion("key", completion("gpt-4o"))
+    flush_writes()
+
+    entry = asyncio.run(ResponseCache(cache_dir=str(tmp_path)).get("key"))
+    assert entry["content"] == "你好"
+    assert ResponseCache.build_completion(entry)["model"] == "gpt-4o"
+
+def test_disk_prune(tmp_path):
+    cache = ResponseCache(ttl=60, cache_dir=str(tmp_path), disk_max_entries=2)
+    for index in range(4):
+        cache.record_completion(f"key{index}", completion("gpt-4o"))
+    flush_writes()
+    # key0 已过期，其余三个中最旧的 key1 超出数量上限
+    now = os.path.getmtime(tmp_path / "key0.json")
+    for index, written_at in enumerate((now - 120, now - 3, now - 2, now - 1)):
+        os.utime(tmp_path / f"key{index}.json", (written_at, written_at))
+    cache._prune_disk()
+    assert sorted(path.name for path in tmp_path.glob("*.json")) == ["key2.json", "key3.json"]
+
+def test_no_store_skips_the_write(client, monkeypatch):
+    cache = ResponseCache()
+    cache.enabled = True
+    monkeypatch.setattr(main, "response_cache", cache)
+
+    def ask(headers):
+        return client.post("/v1/chat/completions", headers=headers, json={
+            "model": "openai",
+            "stream": False,
+            "temperature": 0,
+            "messages": [{"role": "user", "content": "你好"}]
+        })
+
+    assert ask({"Cache-Control": "no-store"}).status_code == 200
+    assert cache.stats()["entries"] == 0
+    assert ask({}).status_code == 200
+    assert cache.stats()["entries"] == 1
+
+def image_message(data):
+    return [{"role": "user", "content": [
+        {"type": "text", "text": "这是什么"},
+        {"type": "image_url", "image_url": {"url": f"data:image/png;base64,{data}"}}
+    ]}]
+
+def test_key_hashes_images_without_serializing_them(monkeypatch):
+    key = ResponseCache.make_key("m", image_message("AAAA"), 0, None)
+    assert key == ResponseCache.make_key("m", image_message("AAAA"), 0, None)
+    assert key != ResponseCache.make_key("m", image_message("BBBB"), 0, None)
+
+    serialized = []
+    dumps = json.dumps
+
+    def recording_dumps(value, **kwargs):
+        serialized.append(dumps(value, **kwargs))
+        return serialized[-1]
+    monkeypatch.setattr(json, "dumps", recording_dumps)
+    ResponseCache.make_key("m", image_message("A" * 1000), 0, None)
+    assert serialized and all("A" * 1000 not in text for text in serialized)
@@ -0,0 +1,28 @@
+def ask(client, question):
+    return client.post("/v1/chat/completions", json={
+        "model": "GeminiMIXR1",
+        "stream": False,
+        "messages": [{"role": "user", "content": question}]
+    })
+
+def test_repeated_question_hits_search_caches(client, upstream):
+    # mock 上游对所有非流式调用都回复 yes：需要搜索，搜索词和搜索结果也都是 yes
+    upstream["reply"] = "yes"
+
+    assert ask(client, "今天有什么新闻？").status_code == 200
+    stats = client.get("/cache/stats").json()
+    assert stats["search_decision"]["misses"] == 1
+    assert stats["search_result"]["misses"] == 1
+
+    response = ask(client, "今天有什么新闻？")
+    assert response.status_code == 200
+    assert response.json()["choices"][0]["message"]["content"]
+    stats = client.get("/cache/stats").json()
+    assert stats["search_decision"]["hits"] == 1
+    assert stats["search_result"]["hits"] == 1
+
+def test_greeting_skips_search_decision(client):
+    assert ask(client, "你好").status_code == 200
+    stats = client.get("/cache/stats").json()
+    assert stats["search_decision"]["skipped"] == 1
+    assert stats["search_decision"]["misses"] == 0
@@ -0,0 +1,50 @@
+import asyncio
+
+from modules.state_backend import SQLiteBackend, TTLCache, RuntimeConfig, flush_writes
+
+class Target:
+    PROXY_URL = "http://old"
+
+def test_sqlite_cache_is_shared_between_workers(tmp_path):
+    backend = SQLiteBackend(str(tmp_path / "state.db"))
+    writer = TTLCache(16, 60, "url", backend)
+    reader = TTLCache(16, 60, "url", backend)
+
+    writer.set("https://example.com", "页面内容")
+    # 写入在后台线程中进行，set 返回时本进程的 LRU 已可读
+    assert asyncio.run(writer.get("https://example.com")) == "页面内容"
+    flush_writes()
+    assert asyncio.run(reader.get("https://example.com")) == "页面内容"
+    assert asyncio.run(reader.get("https://example.com/missing")) is None
+
+def test_runtime_config_reaches_other_workers(tmp_path):
+    backend = SQLiteBackend(str(tmp_path / "state.db"))
+    local, remote = Target(), Target()
+    RuntimeConfig(local, backend).update({"PROXY_URL": "http://new"})
+    assert local.PROXY_URL == "http://new"
+
+    flush_writes()
+    asyncio.run(RuntimeConfig(remote, backend).refresh(force=True))
+    assert remote.PROXY_URL == "http://new"
+
+def test_refresh_does_not_revert_a_pending_update(tmp_path):
+    backend = SQLiteBackend(str(tmp_path / "state.db"))
+    local = Target()
+    config = RuntimeConfig(local, backend)
+    config.update({"PROXY_URL": "http://new"})
+    flush_writes()
+    # 模拟 refresh 读到的是本次修改写入之前的旧记录
+    backend.set(RuntimeConfig.NAMESPACE, "PROXY_URL", {"value": "http://stale", "base": "http://old", "updated_at": 0.0})
+
+    asyncio.run(config.refresh(force=True))
+    assert local.PROXY_URL == "http://new"
+
+def test_rotated_env_value_wins_over_stored_override(tmp_path):
+    backend = SQLiteBackend(str(tmp_path / "state.db"))
+    RuntimeConfig(Target(), backend).update({"PROXY_URL": "http://new"})
+    flush_writes()
+
+    restarted = Target()
+    restarted.PROXY_URL = "http://rotated"
+    asyncio.run(RuntimeConfig(restarted, backend).refresh(force=True))
+    assert restarted.PROXY_URL == "http://rotated"
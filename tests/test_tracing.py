@@ -0,0 +1,15 @@
+from modules.tracing import Tracer
+
+TRACEPARENT = "00-0af7651916cd43dd8448eb211c80319c-b7ad6b7169203331-01"
+
+def test_client_cannot_force_sampling(monkeypatch):
+    tracer = Tracer()
+    monkeypatch.setattr(tracer, "sample_rate", 0.0)
+    root = tracer.start_trace("request", TRACEPARENT)
+    assert not root.sampled
+    assert root.trace_id == "0af7651916cd43dd8448eb211c80319c"
+
+def test_sampling_follows_local_rate(monkeypatch):
+    tracer = Tracer()
+    monkeypatch.setattr(tracer, "sample_rate", 1.0)
+    assert tracer.start_trace("request", TRACEPARENT.replace("-01", "-00")).sampled
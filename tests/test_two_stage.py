@@ -0,0 +1,35 @@
+import json
+
+from config.settings import settings
+
+def test_speculative_output_is_redone_with_full_reasoning(client, upstream, upstream_calls, monkeypatch):
+    upstream["reasoning_tokens"] = 4
+    monkeypatch.setattr(settings, "TWO_STAGE_SPECULATIVE_CHARS", 1)
+
+    response = client.post("/v1/chat/completions", json={
+        "model": settings.HYBRID_MODEL_NAME,
+        "stream": True,
+        "messages": [{"role": "user", "content": "你好"}]
+    })
+    lines = [line for line in response.text.splitlines() if line.startswith("data: ")]
+    assert lines[-1] == "data: [DONE]"
+
+    # 投机调用只带第一段推理，可能在发出前就被取消；最终回答必须基于完整推理
+    outputs = [body for _, body in upstream_calls if body["model"] == "mock-output"]
+    assert outputs[-1]["messages"][-1]["content"] == settings.OUTPUT_REASONING_PROMPT + "think " * 4
+    content = "".join(
+        json.loads(line[6:])["choices"][0]["delta"].get("content") or "" for line in lines[:-1]
+    )
+    assert content == "token " * 3
+
+def test_speculative_output_kept_when_reasoning_is_complete(client, upstream, upstream_calls, monkeypatch):
+    upstream["reasoning_tokens"] = 1
+    monkeypatch.setattr(settings, "TWO_STAGE_SPECULATIVE_CHARS", 1)
+
+    response = client.post("/v1/chat/completions", json={
+        "model": settings.HYBRID_MODEL_NAME,
+        "stream": True,
+        "messages": [{"role": "user", "content": "你好"}]
+    })
+    assert response.text.rstrip().endswith("data: [DONE]")
+    assert len([body for _, body in upstream_calls if body["model"] == "mock-output"]) == 1
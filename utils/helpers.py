@@ -2,19 +2,22 @@ from typing import Dict, Any, Union, List
 import json
 
 def sanitize_content(content: Union[str, List[Dict[str, Any]], Dict[str, Any]]) -> Union[str, List[Dict[str, Any]], Dict[str, Any]]:
+    """用于日志输出：图片只保留类型前缀和长度，不复制 base64 数据"""
     if isinstance(content, list):
         return [
-            {
-                **item,
-                'image_url': {
-                    **item['image_url'],
-                    'url': f"{item['image_url']['url'][:20]}...[base64]..."
-                }
-            } if item.get('type') == 'image_url' and item.get('image_url', {}).get('url')
+            {'type': 'image_url', 'image_url': {'url': describe_image_url(item['image_url']['url'])}}
+            if item.get('type') == 'image_url' and item.get('image_url', {}).get('url')
             else item
             for item in content
         ]
     return content
 
+def describe_image_url(url: str) -> str:
+    if not url.startswith('data:'):
+        return url
+    header_end = url.find(',', 0, 64)
+    header = url[:header_end] if header_end != -1 else url[:20]
+    return f"{header},...[{len(url)} chars]"
+
 def format_sse_message(data: Dict[str, Any]) -> str:
     return f"data: {json.dumps(data)}\n\n"
\ No newline at end of file
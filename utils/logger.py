@@ -1,9 +1,58 @@
+from contextvars import ContextVar
+from typing import Dict, Tuple
+import sys
+import time
 from loguru import logger
+from config.settings import settings
 
-logger.add(
-    "logs/app.log",
-    rotation="1 MB",
-    retention="10 days",
-    level="INFO",  # 可以根据需要调整日志级别
-    compression="zip"  # 压缩旧日志文件以节省空间
-)
\ No newline at end of file
+# 当前请求的 ID，由 main.py 中的中间件设置
+request_id_var: ContextVar[str] = ContextVar("request_id", default="-")
+
+def _patch_record(record) -> None:
+    record["extra"].setdefault("request_id", request_id_var.get())
+
+def setup_logging() -> None:
+    """统一的日志配置入口：所有 sink 都通过队列异步写入，轮转和压缩在后台线程完成"""
+    handlers = [
+        {
+            "sink": sys.stderr,
+            "level": settings.LOG_LEVEL,
+            "enqueue": True,
+            "format": "{time:YYYY-MM-DD HH:mm:ss.SSS} | {level: <8} | {extra[request_id]} | {name}:{function}:{line} - {message}"
+        },
+        {
+            "sink": settings.LOG_FILE,
+            "level": settings.LOG_LEVEL,
+            "enqueue": True,
+            "serialize": settings.LOG_JSON,
+            "rotation": settings.LOG_ROTATION,
+            "retention": settings.LOG_RETENTION,
+            "compression": settings.LOG_COMPRESSION or None
+        }
+    ]
+    logger.configure(handlers=handlers, patcher=_patch_record)
+
+class RateLimitedLogger:
+    """对重复出现的上游错误限流：每个 key 在一个时间窗口内最多记录 limit 条，其余只计数"""
+
+    def __init__(self, limit: int = settings.LOG_ERROR_RATE_LIMIT, window: float = settings.LOG_ERROR_RATE_WINDOW):
+        self.limit = limit
+        self.window = window
+        # key -> (窗口开始时间, 已记录条数, 被抑制条数)
+        self._windows: Dict[str, Tuple[float, int, int]] = {}
+
+    def error(self, key: str, message: str) -> None:
+        now = time.monotonic()
+        started, logged, suppressed = self._windows.get(key, (now, 0, 0))
+        if now - started >= self.window:
+            if suppressed:
+                logger.warning(f"{key}: 上一个 {self.window:.0f} 秒内有 {suppressed} 条相同错误被抑制")
+            started, logged, suppressed = now, 0, 0
+        if logged < self.limit:
+            logger.opt(depth=1).error(message)
+            logged += 1
+        else:
+            suppressed += 1
+        self._windows[key] = (started, logged, suppressed)
+
+upstream_error_logger = RateLimitedLogger()
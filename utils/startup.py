@@ -0,0 +1,30 @@
+from pathlib import Path
+from typing import Dict, Any, Optional
+import sys
+import time
+
+# 体积较大、应按需导入的模块；启动报告会列出其中已被导入的
+HEAVY_MODULES = ('pandas', 'pdfplumber', 'mammoth', 'bs4', 'chardet', 'aiohttp')
+
+def rss_mb() -> Optional[float]:
+    """当前进程的常驻内存（MB）；非 Linux 环境退回到峰值 RSS"""
+    try:
+        for line in Path("/proc/self/status").read_text().splitlines():
+            if line.startswith("VmRSS:"):
+                return round(int(line.split()[1]) / 1024, 1)
+    except OSError:
+        pass
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+def startup_report(started: float) -> Dict[str, Any]:
+    """started 为 main 模块开始导入时的 time.perf_counter()"""
+    return {
+        "startup_seconds": round(time.perf_counter() - started, 3),
+        "rss_mb": rss_mb(),
+        "heavy_modules": [name for name in HEAVY_MODULES if name in sys.modules]
+    }